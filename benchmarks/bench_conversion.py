@@ -0,0 +1,233 @@
+"""Offline conversion benchmark for MSC Playlist Converter.
+
+Generates synthetic audio with FFmpeg's lavfi sources (no network, no real
+music needed), then runs convert_track over every combination of
+high_quality x normalize_audio x mono_audio for each fixture and reports:
+
+- wall:     seconds from start to finished .ogg
+- cpu:      CPU seconds used by FFmpeg (all passes) and this process
+- realtime: seconds of audio converted per second of wall time
+- size:     bytes of the output file
+
+Loudness analysis is measured cold (as on a first conversion) unless
+--warm-loudness is given. Results are written as JSON and can be compared
+with an earlier run to catch regressions between commits.
+
+Usage:
+    python benchmarks/bench_conversion.py --json conversion.json
+    python benchmarks/bench_conversion.py --quick --baseline conversion.json
+    python benchmarks/bench_conversion.py --fixtures flac_48k_stereo --repeat 3
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import MSCPlaylistConverter as app
+
+FIXTURE_DIR = os.path.join(app.APP_TEMP_DIR, 'bench', 'fixtures')
+
+# name: (duration seconds, sample rate, channels, extension, FFmpeg encoder args)
+FIXTURES = {
+    'mp3_44k_stereo': (180, 44100, 2, 'mp3', ['-c:a', 'libmp3lame', '-b:a', '192k']),
+    'flac_48k_stereo': (240, 48000, 2, 'flac', ['-c:a', 'flac']),
+    'aac_44k_stereo': (200, 44100, 2, 'm4a', ['-c:a', 'aac', '-b:a', '160k']),
+    'wav_22k_mono': (120, 22050, 1, 'wav', ['-c:a', 'pcm_s16le']),
+    'ogg_48k_stereo_long': (600, 48000, 2, 'ogg', ['-c:a', 'libvorbis', '-q:a', '5']),
+    'mp3_32k_mono_short': (30, 32000, 1, 'mp3', ['-c:a', 'libmp3lame', '-b:a', '64k']),
+}
+QUICK_DURATION = 20
+
+MATRIX = list(itertools.product((True, False), repeat=3))  # high_quality, normalize_audio, mono_audio
+
+def make_fixture(name, quick=False):
+    """Render a fixture once and reuse it; returns (path, duration)."""
+    duration, rate, channels, ext, codec_args = FIXTURES[name]
+    if quick:
+        duration = min(duration, QUICK_DURATION)
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    path = os.path.join(FIXTURE_DIR, f"{name}_{duration}s.{ext}")
+    if os.path.exists(path):
+        return path, duration
+    # A tone over pink noise, so encoders and loudnorm see something closer to music than silence
+    cmd = [
+        app.FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f"sine=frequency=220:sample_rate={rate}:duration={duration}",
+        '-f', 'lavfi', '-i', f"anoisesrc=color=pink:amplitude=0.2:sample_rate={rate}:duration={duration}",
+        '-filter_complex', 'amix=inputs=2:duration=shortest',
+        '-ac', str(channels), '-ar', str(rate),
+    ] + codec_args + [path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        if os.path.exists(path):
+            os.remove(path)
+        raise RuntimeError(f"Could not generate fixture {name}: {result.stderr.strip()}")
+    return path, duration
+
+def cpu_seconds():
+    """CPU time of this process plus finished child processes, or None where unavailable."""
+    if resource is None:
+        return None
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+def run_case(fixture_path, duration, high_quality, normalize_audio, mono_audio, work_dir, run_id, warm_loudness):
+    """Convert one fixture with one setting; returns a measurement dict."""
+    out_dir = os.path.join(work_dir, f"run{run_id}")
+    os.makedirs(out_dir, exist_ok=True)
+    source_key = f"bench:{os.path.basename(fixture_path)}"
+    if not warm_loudness:
+        # A fresh cache file means every normalized run pays for its own analysis pass
+        app._loudness_cache = app.LoudnessCache(os.path.join(work_dir, f"loudness_{run_id}.json"))
+        source_key += f":{run_id}"
+
+    cpu_before = cpu_seconds()
+    started = time.perf_counter()
+    success, result = app.convert_track(fixture_path, 1, out_dir, high_quality, None, delete_original=False,
+                                        normalize_audio=normalize_audio, mono_audio=mono_audio,
+                                        source_key=source_key, duration=duration)
+    wall = time.perf_counter() - started
+    cpu_after = cpu_seconds()
+    if not success:
+        raise RuntimeError(f"Conversion failed: {result}")
+    return {
+        'wall': wall,
+        'cpu': None if cpu_before is None else cpu_after - cpu_before,
+        'size': os.path.getsize(result),
+    }
+
+def run_matrix(fixture_names, repeat, quick, warm_loudness):
+    work_dir = tempfile.mkdtemp(prefix='msc_bench_')
+    results = []
+    run_id = 0
+    try:
+        for name in fixture_names:
+            path, duration = make_fixture(name, quick)
+            for high_quality, normalize_audio, mono_audio in MATRIX:
+                samples = []
+                for _ in range(repeat):
+                    run_id += 1
+                    samples.append(run_case(path, duration, high_quality, normalize_audio, mono_audio,
+                                            work_dir, run_id, warm_loudness))
+                wall = statistics.median(s['wall'] for s in samples)
+                cpu = None if samples[0]['cpu'] is None else statistics.median(s['cpu'] for s in samples)
+                entry = {
+                    'fixture': name,
+                    'high_quality': high_quality,
+                    'normalize_audio': normalize_audio,
+                    'mono_audio': mono_audio,
+                    'encoding': app.get_encoding_args(high_quality, normalize_audio, mono_audio),
+                    'audio_seconds': duration,
+                    'wall': round(wall, 4),
+                    'cpu': None if cpu is None else round(cpu, 4),
+                    'realtime': round(duration / wall, 2) if wall else None,
+                    'size': samples[-1]['size'],
+                }
+                results.append(entry)
+                print_entry(entry)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def case_key(entry):
+    return f"{entry['fixture']} hq={int(entry['high_quality'])} norm={int(entry['normalize_audio'])} mono={int(entry['mono_audio'])}"
+
+def print_entry(entry):
+    cpu = f"{entry['cpu']:7.2f}s" if entry['cpu'] is not None else "    n/a"
+    print(f"{case_key(entry):<40} wall {entry['wall']:7.2f}s  cpu {cpu}  "
+          f"{entry['realtime']:7.1f}x realtime  {entry['size'] / 1024:9.1f} KB")
+
+def compare(results, baseline, max_regression, max_size_growth):
+    """List cases that got slower or bigger than the baseline allows."""
+    previous = {case_key(entry): entry for entry in baseline.get('results', [])}
+    regressions = []
+    for entry in results:
+        old = previous.get(case_key(entry))
+        if not old:
+            continue
+        for metric in ('wall', 'cpu'):
+            if entry[metric] and old.get(metric) and entry[metric] > old[metric] * (1 + max_regression):
+                regressions.append(f"{case_key(entry)}: {metric} {entry[metric]:.2f}s vs {old[metric]:.2f}s")
+        if old.get('size') and entry['size'] > old['size'] * (1 + max_size_growth):
+            regressions.append(f"{case_key(entry)}: size {entry['size']} vs {old['size']} bytes")
+    return regressions
+
+def ffmpeg_version():
+    try:
+        result = subprocess.run([app.FFMPEG_PATH, '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        return result.stdout.splitlines()[0] if result.stdout else None
+    except OSError:
+        return None
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark conversions over the encoding-settings matrix.")
+    parser.add_argument('--fixtures', nargs='+', choices=list(FIXTURES), default=list(FIXTURES),
+                        help="fixtures to run (default: all)")
+    parser.add_argument('--quick', action='store_true', help=f"cap fixtures at {QUICK_DURATION}s of audio")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per case; the median is reported")
+    parser.add_argument('--warm-loudness', action='store_true', help="reuse loudness analysis between runs")
+    parser.add_argument('--ffmpeg', help="FFmpeg executable (default: the bundled one, then PATH)")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="results file from an earlier run to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="allowed wall/CPU slowdown as a fraction (default: 0.2)")
+    parser.add_argument('--max-size-growth', type=float, default=0.05,
+                        help="allowed output size growth as a fraction (default: 0.05)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    if args.ffmpeg:
+        app.FFMPEG_PATH = args.ffmpeg
+    elif not os.path.exists(app.FFMPEG_PATH) and shutil.which('ffmpeg'):
+        app.FFMPEG_PATH = shutil.which('ffmpeg')
+
+    results = run_matrix(args.fixtures, max(1, args.repeat), args.quick, args.warm_loudness)
+    report = {
+        'commit': git_commit(),
+        'ffmpeg': ffmpeg_version(),
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'cpu_count': os.cpu_count(),
+        'two_pass_normalization': app.TWO_PASS_NORMALIZATION,
+        'quick': args.quick,
+        'warm_loudness': args.warm_loudness,
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.max_regression, args.max_size_growth)
+        for line in regressions:
+            print(f"FAIL: {line}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
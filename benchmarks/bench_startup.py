@@ -0,0 +1,141 @@
+"""Startup-time benchmark for MSC Playlist Converter.
+
+Every measurement runs in a fresh interpreter so module caches from one run
+can't hide the cost of the next:
+
+- import:     importing the module (what every entry point pays)
+- cli_help:   `MSCPlaylistConverter.py --help`, a full command-line start
+- gui_window: until the main window has been built and drawn once
+              (skipped when Tk or a display is unavailable)
+
+It also fails when importing the module pulls in yt-dlp, tkinter or PIL,
+which should only load when they are needed.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --json results.json
+    python benchmarks/bench_startup.py --baseline results.json --max-regression 0.25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+SCRIPT = os.path.join(SRC_DIR, 'MSCPlaylistConverter.py')
+
+# Modules that must not be loaded just by importing the converter
+LAZY_MODULES = ('yt_dlp', 'tkinter', 'PIL')
+
+IMPORT_PROBE = f"""
+import sys, time, json
+start = time.perf_counter()
+sys.path.insert(0, {SRC_DIR!r})
+import MSCPlaylistConverter
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+GUI_PROBE = f"""
+import sys, time, json
+start = time.perf_counter()
+sys.path.insert(0, {SRC_DIR!r})
+import MSCPlaylistConverter as app
+app.setup_logging()
+try:
+    app.load_gui_modules()
+    root = app.tk.Tk()
+except Exception as e:
+    print(json.dumps({{'skipped': str(e)}}))
+    sys.exit(0)
+gui = app.MSCPlaylistGUI(root)
+root.update()
+elapsed = time.perf_counter() - start
+root.destroy()
+print(json.dumps({{'seconds': elapsed}}))
+"""
+
+def run_probe(args):
+    """Run a child interpreter and return (wall seconds, parsed JSON from its last stdout line)."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args[:2])} failed: {result.stderr.strip()[-500:]}")
+    lines = result.stdout.strip().splitlines()
+    try:
+        return wall, json.loads(lines[-1]) if lines else {}
+    except ValueError:
+        return wall, {}
+
+def measure(runs):
+    """Median timings over the given number of runs, plus any eagerly loaded modules."""
+    samples = {'import': [], 'cli_help': [], 'gui_window': []}
+    loaded = set()
+    gui_skipped = None
+    for _ in range(runs):
+        _, probe = run_probe(['-c', IMPORT_PROBE])
+        samples['import'].append(probe['seconds'])
+        loaded.update(probe['loaded'])
+
+        wall, _ = run_probe([SCRIPT, '--help'])
+        samples['cli_help'].append(wall)
+
+        if gui_skipped is None:
+            _, probe = run_probe(['-c', GUI_PROBE])
+            if 'skipped' in probe:
+                gui_skipped = probe['skipped']
+            else:
+                samples['gui_window'].append(probe['seconds'])
+
+    results = {name: round(statistics.median(values), 4) for name, values in samples.items() if values}
+    return results, sorted(loaded), gui_skipped
+
+def compare(results, baseline, max_regression):
+    """Return a list of measurements that got slower than baseline by more than max_regression."""
+    regressions = []
+    for name, seconds in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous and seconds > previous * (1 + max_regression):
+            regressions.append(f"{name}: {seconds:.3f}s vs {previous:.3f}s baseline "
+                               f"(+{(seconds / previous - 1) * 100:.0f}%)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure MSC Playlist Converter startup time.")
+    parser.add_argument('--runs', type=int, default=5, help="fresh-process runs per measurement (default: 5)")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="results file from an earlier run to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help="allowed slowdown against the baseline as a fraction (default: 0.25)")
+    args = parser.parse_args()
+
+    results, loaded, gui_skipped = measure(max(1, args.runs))
+    for name, seconds in results.items():
+        print(f"{name:<12} {seconds * 1000:8.1f} ms")
+    if gui_skipped:
+        print(f"gui_window   skipped ({gui_skipped})")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'platform': sys.platform, 'runs': args.runs,
+                       'results': results}, f, indent=1)
+
+    failed = False
+    if loaded:
+        print(f"FAIL: importing the module loaded {', '.join(loaded)}")
+        failed = True
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"FAIL: {line}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,7 +24,6 @@ def main():
         "--add-data", f"{src_dir / 'resources'};resources",  # Include resources folder
         "--add-data", f"{src_dir / 'resources' / 'ffmpeg'};ffmpeg",  # Include ffmpeg folder specifically
         "--add-data", f"{icon_path};.",                      # Include icon file in root
-        "--hidden-import=PIL._tkinter_finder",               # Ensure PIL works
         "--collect-all=yt_dlp",                              # Include all yt-dlp dependencies
         "--clean",                                           # Clean PyInstaller cache
         str(main_script)
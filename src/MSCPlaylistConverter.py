@@ -4,15 +4,31 @@ import threading
 import subprocess
 import time
 import logging
+import logging.handlers
+import atexit
 import urllib.parse
 import tempfile
 import re
+import difflib
+import json
+import hashlib
 import shutil
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-from tkinter.scrolledtext import ScrolledText
-import yt_dlp
-from PIL import Image
+import glob
+import queue
+import functools
+import contextlib
+import argparse
+import signal
+import math
+import array
+import random
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# yt-dlp takes longer to import than the rest of the app together; load_yt_dlp() imports it on first use
+yt_dlp = None
+# Tk is only imported when the GUI starts, so the command line works on machines without a display
+tk = ttk = messagebox = filedialog = ScrolledText = None
 
 try:
     import winreg
@@ -34,6 +50,16 @@ STANDARD_QUALITY_CHANNELS = "2"
 NORMALIZATION_LOUDNESS = "-18"
 NORMALIZATION_LRA = "11"
 NORMALIZATION_TRUE_PEAK = "-1.5"
+# Measure loudness in a separate pass first, then encode with loudnorm in linear mode
+TWO_PASS_NORMALIZATION = True
+
+# Size budget mode: (minimum kbps, channels, sample rate) rungs, best first. Each rung's
+# bitrate range was checked against libvorbis, which refuses bitrates outside it. The top
+# rungs stay within the audit limits, so a generous budget never picks the slow-loading format.
+BUDGET_LADDER = [(96, 2, 44100), (64, 2, 32000), (40, 2, 22050), (24, 1, 22050), (16, 1, 16000)]
+BUDGET_MONO_LADDER = [(64, 1, 44100), (40, 1, 32000), (24, 1, 22050), (16, 1, 16000)]
+BUDGET_SAFETY_MARGIN = 0.95  # Vorbis only holds its bitrate on average, and Ogg framing and tags add a little
+BUDGET_DEFAULT_TRACK_SECONDS = 240  # Assumed length of tracks whose duration isn't known yet
 
 # yt-dlp configuration presets
 BASE_YDL_OPTS = {
@@ -60,12 +86,122 @@ SEARCH_OPTS = {
     'extract_flat': True,
 }
 
+# Pipeline concurrency settings
+DOWNLOAD_WORKERS = 3
+CONVERT_WORKERS = max(1, os.cpu_count() or 1)
+PIPELINE_QUEUE_SIZE = 4  # Downloaded tracks allowed to wait for an FFmpeg worker
+
+# Download retries: transient errors are retried with jittered exponential backoff, and tracks
+# that still fail that way get one more round at the end of the run
+DOWNLOAD_RETRIES = 3
+RETRY_BASE_DELAY = 2.0  # Seconds; doubles with every attempt
+RETRY_MAX_DELAY = 60.0
+RETRY_QUEUE_DELAY = 15.0  # Pause before the end-of-run round, so throttled hosts can recover
+RETRYABLE_HTTP_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# Per-host token buckets: (requests per second, burst)
+HOST_RATE_LIMITS = {'youtube.com': (1.0, 3), 'soundcloud.com': (2.0, 4)}
+DEFAULT_HOST_RATE_LIMIT = (2.0, 4)
+
+# Region-lock fallback search settings
+FALLBACK_SEARCH_WORKERS = 4
+FALLBACK_RESULTS_PER_QUERY = 3
+FALLBACK_CONFIDENT_SCORE = 0.85  # Stop searching once a candidate scores this high
+FALLBACK_MIN_SCORE = 0.3  # Candidates below this are not used at all
+FALLBACK_MIN_DURATION = 60
+FALLBACK_MAX_DURATION = 20 * 60
+FALLBACK_CACHE_TTL = 90 * 24 * 3600
+FALLBACK_NEGATIVE_CACHE_TTL = 7 * 24 * 3600
+
+# Streaming mode pipes the download straight into FFmpeg instead of writing it to disk first
+STREAMING_MODE = False
+# Containers FFmpeg can decode from a non-seekable pipe (MP4/M4A need to seek to their index)
+STREAMABLE_EXTS = {'webm', 'weba', 'ogg', 'opus', 'mp3', 'aac', 'flac', 'wav', 'mka'}
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Seconds a cancelled FFmpeg process gets to exit before it is killed
+CANCEL_KILL_TIMEOUT = 2.0
+
+# How often the GUI refreshes the progress bar and ETA
+PROGRESS_POLL_MS = 1000
+
 # SoundCloud region-lock detection (preview track duration range in seconds)
 REGION_LOCK_MIN_DURATION = 29
 REGION_LOCK_MAX_DURATION = 31
 
 # Centralized temporary directory path
 APP_TEMP_DIR = os.path.join(tempfile.gettempdir(), 'MSC-Playlist-Converter')
+CACHE_DIR = os.path.join(APP_TEMP_DIR, 'cache')
+# Result of the Steam library search, reused until Steam's library list changes
+MSC_PATH_CACHE_FILE = os.path.join(CACHE_DIR, 'msc_path.json')
+
+# Per-folder record of which source lives in which trackN.ogg
+MANIFEST_FILENAME = "msc_converter_manifest.json"
+# Journals of unfinished runs, one per output folder, used to resume them
+JOURNAL_DIR = os.path.join(APP_TEMP_DIR, 'jobs')
+
+# Playlist enumeration cache settings
+PLAYLIST_CACHE_TTL = 600
+PLAYLIST_PROBE_SIZE = 100  # Leading entries compared to decide a playlist is unchanged
+PLAYLIST_FULL_REFRESH_AGE = 24 * 3600  # After this long the whole playlist is listed again, whatever the probe says
+PLAYLIST_MAX_REDIRECTS = 3  # URL results followed before paging, e.g. watch?list=... to the playlist page
+
+# Converted .ogg cache settings
+CONVERSION_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Housekeeping of APP_TEMP_DIR: (max bytes, max age in seconds) per subdirectory, None for no limit.
+# Downloads and temp copies never outlive a run, so old ones are leftovers of a crashed run.
+# The conversion cache bounds itself (CONVERSION_CACHE_MAX_BYTES) and is not listed.
+TEMP_STORAGE_LIMITS = {
+    'downloads': (1024 * 1024 * 1024, 3600),
+    'temp_files': (512 * 1024 * 1024, 3600),
+    'thumbnails': (64 * 1024 * 1024, 7 * 24 * 3600),
+    'logs': (100 * 1024 * 1024, 30 * 24 * 3600),
+    'jobs': (None, 30 * 24 * 3600),
+}
+TEMP_GRACE_SECONDS = 600  # Files touched more recently may belong to a running job and are always kept
+
+# Whether tracks added to a folder reuse numbers left free by deleted tracks instead of going after the last one
+FILL_TRACK_GAPS = False
+
+# Library audit of the game's Radio/CD folders: tracks above these limits are reported
+AUDIT_MAX_SAMPLE_RATE = 44100  # 48kHz High Quality tracks take longer to load
+AUDIT_MAX_BITRATE = 192  # kb/s
+AUDIT_MAX_TRACK_BYTES = 12 * 1024 * 1024
+AUDIT_TRUNCATION_TOLERANCE = 1.0  # Seconds the decodable audio may fall short of the stated length
+
+# Local files picked up from folders given on the command line
+LOCAL_AUDIO_EXTS = ('.mp3', '.wav', '.ogg', '.flac', '.aac', '.m4a')
+
+# Tracks listed in the end-of-run timing report
+TRACE_SLOWEST_TRACKS = 5
+
+# Duplicate detection: the same source ID is always downloaded once; the acoustic check
+# also catches reuploads. "skip" leaves a duplicate out, "link" hard-links the kept file.
+ACOUSTIC_DEDUPE = False
+DUPLICATE_POLICY = "skip"
+FINGERPRINT_SECONDS = 90  # Audio analysed from the start of each track
+FINGERPRINT_SAMPLE_RATE = 4000
+FINGERPRINT_BLOCK = 0.1  # Seconds of audio per energy value
+FINGERPRINT_BANDS = ('lowpass=f=250', 'bandpass=f=425:width_type=h:w=350',
+                     'bandpass=f=900:width_type=h:w=600', 'highpass=f=1200')
+FINGERPRINT_MAX_OFFSET = 5  # Seconds of extra intro a reupload may have
+FINGERPRINT_MAX_LENGTH_DIFF = 15  # Tracks whose lengths differ more than this are never compared
+FINGERPRINT_MATCH = 0.85  # Similarity (0-1) from which two tracks count as the same song
+
+# Log files rotate at this size; older parts are kept up to the backup count
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+# FFmpeg's stderr is kept in a ring buffer of this many lines, and written to
+# logs/ffmpeg only when a conversion fails
+FFMPEG_LOG_LINES = 200
+FFMPEG_ERROR_TAIL_LINES = 10  # Lines of it quoted in the error message
+
+# Command-line exit codes
+EXIT_OK = 0
+EXIT_PARTIAL = 1  # Some tracks failed
+EXIT_USAGE = 2
+EXIT_FAILED = 3  # Nothing was converted
+EXIT_CANCELLED = 130
 
 def setup_logging():
     """Initialize logging system with timestamped log files."""
@@ -75,14 +211,22 @@ def setup_logging():
     timestamp = time.strftime('%Y%m%d_%H%M%S')
     log_file = os.path.join(log_dir, f'msc_converter_{timestamp}.log')
     
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
+    # Workers only put records on a queue; one listener thread does the file and console writes
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    handlers = [
+        logging.handlers.RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                             encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))  # The listener's handlers add the prefix
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
     
     logger = logging.getLogger(__name__)
     logger.info(f"MSC Playlist Converter")
@@ -92,7 +236,16 @@ def setup_logging():
     logger.info(f"App temp directory: {APP_TEMP_DIR}")
     return logger
 
-logger = setup_logging()
+# Handlers are attached by setup_logging() when the GUI or command line starts
+logger = logging.getLogger(__name__)
+
+def load_yt_dlp():
+    """Import yt-dlp on first use."""
+    global yt_dlp
+    if yt_dlp is None:
+        import yt_dlp as module
+        yt_dlp = module
+    return yt_dlp
 
 def resource_path(relative_path):
     """Get absolute path to resource file."""
@@ -137,8 +290,34 @@ def get_steam_libraries(steam_path):
     return library_paths
 
 def find_msc_install_path():
-    """Locate My Summer Car installation directory across Steam libraries."""
+    """Locate My Summer Car installation directory, reusing the last search when Steam hasn't changed.
+
+    The cached result is keyed on the Steam path and the modification time of
+    libraryfolders.vdf, which Steam rewrites whenever a library or game is
+    added or removed. A cached install folder that no longer exists forces a
+    new search as well.
+    """
     steam_path = get_steam_path()
+    try:
+        vdf_mtime = os.path.getmtime(os.path.join(steam_path, "steamapps", "libraryfolders.vdf"))
+    except OSError:
+        vdf_mtime = None
+    fingerprint = {'steam_path': steam_path, 'vdf_mtime': vdf_mtime}
+    cached = load_json_file(MSC_PATH_CACHE_FILE, {})
+    if cached.get('fingerprint') == fingerprint and cached.get('path') \
+            and (not cached.get('found') or os.path.isdir(cached['path'])):
+        logger.info(f"Using cached My Summer Car path: {cached['path']}")
+        return cached['path']
+
+    msc_dir, found = search_msc_install_path(steam_path)
+    try:
+        write_json_atomic(MSC_PATH_CACHE_FILE, {'fingerprint': fingerprint, 'path': msc_dir, 'found': found})
+    except OSError as e:
+        logger.warning(f"Could not cache My Summer Car path: {e}")
+    return msc_dir
+
+def search_msc_install_path(steam_path):
+    """Probe every Steam library for My Summer Car; returns (path, found)."""
     libraries = get_steam_libraries(steam_path)
     logger.info(f"Searching for My Summer Car in {len(libraries)} Steam libraries")
     
@@ -146,13 +325,28 @@ def find_msc_install_path():
         msc_dir = os.path.join(lib, "common", "My Summer Car")
         if os.path.isdir(msc_dir):
             logger.info(f"Found My Summer Car installation at: {msc_dir}")
-            return msc_dir
+            return msc_dir, True
     
     default_path = r"C:\Program Files (x86)\Steam\steamapps\common\My Summer Car"
     logger.warning(f"My Summer Car not found, using default path: {default_path}")
-    return default_path
+    return default_path, False
+
+_msc_path = None
+_msc_path_lock = threading.Lock()
+
+def get_msc_path():
+    """Return the My Summer Car folder, finding it on first use."""
+    global _msc_path
+    with _msc_path_lock:
+        if _msc_path is None:
+            _msc_path = find_msc_install_path()
+        return _msc_path
 
-DEFAULT_MSC_PATH = find_msc_install_path()
+def create_msc_folders():
+    """Make sure the Radio and CD folders exist in the game directory."""
+    logger.info("Creating MSC output directories")
+    for sub in CD_SLOT_MAP.values():
+        os.makedirs(os.path.join(get_msc_path(), sub), exist_ok=True)
 
 CD_SLOT_MAP = {
     "Radio": "Radio",
@@ -177,6 +371,219 @@ def format_file_size_with_extension(filepath):
         _, ext = os.path.splitext(filepath)
         return f"unknown_size{ext}"
 
+def load_json_file(path, default=None):
+    """Read a JSON file, returning default when it is missing or unreadable."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and swap it in, so readers never see half a file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(temp_fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1)
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+_file_hash_cache = {}
+_file_hash_lock = threading.Lock()
+
+def hash_file(filepath):
+    """Return the SHA-256 of a file, remembering it while size and mtime are unchanged."""
+    st = os.stat(filepath)
+    stamp = (os.path.abspath(filepath), st.st_size, st.st_mtime_ns)
+    with _file_hash_lock:
+        if stamp in _file_hash_cache:
+            return _file_hash_cache[stamp]
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    result = digest.hexdigest()
+    with _file_hash_lock:
+        _file_hash_cache[stamp] = result
+    return result
+
+def link_or_copy(src, dst):
+    """Hard-link src to dst, copying when a link is not possible (e.g. across drives)."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return True
+    except OSError:
+        shutil.copy2(src, dst)
+        return False
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, int(-(-pct * len(ordered) // 100)))
+    return ordered[rank - 1]
+
+class RunTrace:
+    """Timing spans for one batch, written as JSON lines next to the log files.
+
+    Each span records a stage (download, encode, ...), the track it belongs
+    to, how long it took and stage-specific details such as bytes moved.
+    Worker threads mark the track they are working on with for_track(), so
+    helpers deep in the call stack don't need to be passed the track number.
+    """
+
+    def __init__(self, label, path=None):
+        timestamp = time.strftime('%Y%m%d_%H%M%S')
+        self.path = path or os.path.join(APP_TEMP_DIR, 'logs', f'trace_{timestamp}.jsonl')
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._spans = []  # (stage, track, seconds)
+        self._file = None
+        self._write_failed = False
+        self._write({'type': 'run', 'label': label, 'start': round(time.time(), 3)})
+
+    def _write(self, record):
+        line = json.dumps(record)
+        with self._lock:
+            if self._write_failed:
+                return
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write(line + "\n")
+                self._file.flush()
+            except OSError as e:
+                self._write_failed = True
+                logger.warning(f"Could not write timing trace: {e}")
+
+    @contextlib.contextmanager
+    def for_track(self, idx):
+        """Attribute spans recorded by this thread to track idx."""
+        previous = getattr(self._local, 'track', None)
+        self._local.track = idx
+        try:
+            yield
+        finally:
+            self._local.track = previous
+
+    @contextlib.contextmanager
+    def span(self, stage, track=None, **attrs):
+        """Time the enclosed block; details added to the yielded dict are saved with it."""
+        started = time.time()
+        perf_started = time.perf_counter()
+        ok = True
+        try:
+            yield attrs
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - perf_started, track, start=started,
+                        **{'ok': ok, **attrs})
+
+    def record(self, stage, seconds, track=None, start=None, **attrs):
+        """Add a span that was timed elsewhere."""
+        if track is None:
+            track = getattr(self._local, 'track', None)
+        with self._lock:
+            self._spans.append((stage, track, seconds))
+        record = {'type': 'span', 'stage': stage, 'track': track,
+                  'start': round(start if start is not None else time.time() - seconds, 3),
+                  'seconds': round(seconds, 4)}
+        record.update(attrs)
+        record.setdefault('ok', True)
+        self._write(record)
+
+    def summary(self, slowest=TRACE_SLOWEST_TRACKS):
+        """Per-stage count/p50/p95/max/total and the tracks that took longest overall."""
+        with self._lock:
+            spans = list(self._spans)
+        by_stage, by_track = {}, {}
+        for stage, track, seconds in spans:
+            by_stage.setdefault(stage, []).append(seconds)
+            if track is not None:
+                stages = by_track.setdefault(track, {})
+                stages[stage] = stages.get(stage, 0.0) + seconds
+        stage_report = {
+            stage: {
+                'count': len(values),
+                'p50': round(percentile(values, 50), 3),
+                'p95': round(percentile(values, 95), 3),
+                'max': round(max(values), 3),
+                'total': round(sum(values), 3),
+            }
+            for stage, values in by_stage.items()
+        }
+        ranked = sorted(by_track.items(), key=lambda item: sum(item[1].values()), reverse=True)
+        slowest_report = [
+            {'track': track, 'seconds': round(sum(stages.values()), 3),
+             'stages': {stage: round(seconds, 3) for stage, seconds in stages.items()}}
+            for track, stages in ranked[:slowest]
+        ]
+        return {'stages': stage_report, 'slowest': slowest_report}
+
+    def finish(self):
+        """Write and log the end-of-run report, then close the trace file."""
+        report = self.summary()
+        self._write({'type': 'summary', 'end': round(time.time(), 3), **report})
+        if report['stages']:
+            logger.info("Stage timings:")
+            for stage, stats in sorted(report['stages'].items(), key=lambda item: -item[1]['total']):
+                logger.info(f"  {stage:<15} n={stats['count']:<4} p50 {stats['p50']:7.2f}s  "
+                            f"p95 {stats['p95']:7.2f}s  total {stats['total']:8.1f}s")
+        if report['slowest']:
+            logger.info("Slowest tracks: " + ", ".join(f"track{entry['track']} {entry['seconds']:.1f}s"
+                                                       for entry in report['slowest']))
+        self.close()
+        logger.info(f"Timing trace saved: {self.path}")
+        return report
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+_run_trace = None
+
+def start_run_trace(label):
+    """Begin tracing a new batch; spans from the helpers below go to it."""
+    global _run_trace
+    if _run_trace is not None:
+        _run_trace.close()
+    _run_trace = RunTrace(label)
+    return _run_trace
+
+def finish_run_trace():
+    """Finish the active trace and return its report, or None when nothing is being traced."""
+    global _run_trace
+    trace, _run_trace = _run_trace, None
+    return trace.finish() if trace else None
+
+def trace_span(stage, track=None, **attrs):
+    """Span on the active run trace; a no-op outside a traced run."""
+    if _run_trace is None:
+        return contextlib.nullcontext(attrs)
+    return _run_trace.span(stage, track, **attrs)
+
+def trace_record(stage, seconds, track=None, **attrs):
+    if _run_trace is not None:
+        _run_trace.record(stage, seconds, track, **attrs)
+
+def trace_track(idx):
+    """Attribute this thread's spans to track idx on the active run trace."""
+    if _run_trace is None:
+        return contextlib.nullcontext()
+    return _run_trace.for_track(idx)
+
 def is_youtube_playlist(url):
     """Check if URL points to a YouTube playlist."""
     return ("youtube.com/playlist" in url or "youtu.be/playlist" in url or
@@ -194,28 +601,448 @@ def is_soundcloud_track(url):
     """Check if URL points to a single SoundCloud track."""
     return "soundcloud.com" in url and not is_soundcloud_playlist(url)
 
+def get_source_id(url):
+    """Return a stable identity for a track URL (the video ID for YouTube)."""
+    parsed = urllib.parse.urlparse(url)
+    host = parsed.netloc.lower()
+    if host.endswith("youtu.be"):
+        return f"youtube:{parsed.path.strip('/')}"
+    if "youtube.com" in host:
+        video_id = urllib.parse.parse_qs(parsed.query).get('v')
+        if video_id:
+            return f"youtube:{video_id[0]}"
+    return f"url:{host}{parsed.path.rstrip('/')}"
+
+def dedupe_urls(urls):
+    """Drop URLs whose source ID already appeared earlier in the list, keeping the order."""
+    seen = set()
+    unique = []
+    for url in urls:
+        source_id = get_source_id(url)
+        if source_id not in seen:
+            seen.add(source_id)
+            unique.append(url)
+    if len(unique) < len(urls):
+        logger.info(f"Skipping {len(urls) - len(unique)} repeated tracks")
+    return unique
+
+def _playlist_entry(entry, youtube):
+    """Reduce a flat playlist entry to the fields the converter keeps."""
+    if youtube:
+        url = f"https://www.youtube.com/watch?v={entry['id']}"
+    else:
+        url = entry.get('url')
+    return {'id': entry.get('id'), 'url': url, 'title': entry.get('title'), 'duration': entry.get('duration')}
+
+def diff_playlist_entries(old_entries, new_entries):
+    """Return (added, removed) entries between two enumerations of a playlist."""
+    old_ids = {get_source_id(e['url']) for e in old_entries}
+    new_ids = {get_source_id(e['url']) for e in new_entries}
+    added = [e for e in new_entries if get_source_id(e['url']) not in old_ids]
+    removed = [e for e in old_entries if get_source_id(e['url']) not in new_ids]
+    return added, removed
+
+class PlaylistCache:
+    """Persistent cache of flat playlist enumerations.
+
+    Within PLAYLIST_CACHE_TTL the stored entries are used as-is. After that a
+    refresh pages through the playlist only until it can tell the rest is
+    unchanged: either the leading page matches and the count is the same, or
+    the previously first entry shows up after new ones were added at the top.
+    Sites that don't report a count (SoundCloud) stop on the leading page
+    alone. Changes further down can't be seen that way, so once the last full
+    listing is PLAYLIST_FULL_REFRESH_AGE old the whole playlist is listed again.
+    """
+
+    def __init__(self, cache_dir=None, ttl=PLAYLIST_CACHE_TTL):
+        self.cache_dir = cache_dir or os.path.join(CACHE_DIR, 'playlists')
+        self.ttl = ttl
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+    def load(self, url):
+        """Return the cached record for a playlist URL, or None."""
+        return load_json_file(self._path(url))
+
+    def get_entries(self, url, youtube):
+        cached = self.load(url)
+        if cached:
+            age = time.time() - cached.get('fetched_at', 0)
+            if age < self.ttl:
+                logger.info(f"Using cached playlist ({len(cached['entries'])} entries, {int(age)}s old)")
+                return cached['entries']
+            logger.info(f"Cached playlist is {int(age)}s old, refreshing")
+
+        started = time.time()
+        verified_at = cached.get('verified_at', 0) if cached else 0
+        known = cached['entries'] if cached and started - verified_at < PLAYLIST_FULL_REFRESH_AGE else None
+        if cached and known is None:
+            logger.info("Last full listing of the playlist is too old, listing it all again")
+        entries, fetched, complete = self._enumerate(url, youtube, known)
+        if complete:
+            verified_at = started
+        logger.info(f"Playlist enumerated in {time.time() - started:.1f}s ({fetched} entries fetched, {len(entries)} total)")
+        if not entries:
+            # Most likely a failed or unsupported enumeration; don't let it stand in for the playlist
+            logger.warning(f"Playlist enumeration returned no entries, not caching it: {url}")
+            return entries
+        if cached:
+            added, removed = diff_playlist_entries(cached['entries'], entries)
+            logger.info(f"Playlist changes since last run: {len(added)} added, {len(removed)} removed")
+        try:
+            write_json_atomic(self._path(url), {'url': url, 'fetched_at': time.time(), 'verified_at': verified_at,
+                                                'entries': entries})
+        except OSError as e:
+            logger.warning(f"Could not save playlist cache: {e}")
+        return entries
+
+    def _enumerate(self, url, youtube, known):
+        """Page through the playlist, stopping early once the cached tail is confirmed.
+
+        Returns (entries, fetched, complete); complete is False when the tail was taken from known.
+        """
+        _host_limiter.acquire(url)
+        with load_yt_dlp().YoutubeDL(EXTRACT_OPTS) as ydl:
+            # process=False keeps the extractor's lazy paging instead of resolving every page up front
+            info = ydl.extract_info(url, download=False, process=False)
+            # Unprocessed results can be redirects, e.g. watch?list=... pointing at the playlist page
+            for _ in range(PLAYLIST_MAX_REDIRECTS):
+                if info.get('_type') not in ('url', 'url_transparent'):
+                    break
+                info = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+            count = info.get('playlist_count')
+            entries = []
+            for raw in info.get('entries') or []:
+                if not raw or not raw.get('id' if youtube else 'url'):
+                    continue
+                entries.append(_playlist_entry(raw, youtube))
+                if not known:
+                    continue
+                n = len(entries)
+                # Without a count, short playlists are listed in full: the probe would be most of them anyway
+                same_length = count == len(known) if count else len(known) > PLAYLIST_PROBE_SIZE
+                if (same_length and n == min(PLAYLIST_PROBE_SIZE, len(known))
+                        and [e['url'] for e in entries] == [e['url'] for e in known[:n]]):
+                    return list(known), n, False
+                if (n > 1 and entries[-1]['url'] == known[0]['url']
+                        and (count - (n - 1) == len(known) if count else len(known) > PLAYLIST_PROBE_SIZE)):
+                    return entries[:-1] + list(known), n, False
+        return entries, len(entries), True
+
+_playlist_cache = None
+_playlist_cache_lock = threading.Lock()
+
+def get_playlist_cache():
+    """Return the shared playlist cache, creating it on first use."""
+    global _playlist_cache
+    with _playlist_cache_lock:
+        if _playlist_cache is None:
+            _playlist_cache = PlaylistCache()
+        return _playlist_cache
+
 def get_soundcloud_playlist_tracks(url):
     """Extract track URLs from a SoundCloud playlist."""
-    with yt_dlp.YoutubeDL(EXTRACT_OPTS) as ydl:
-        info = ydl.extract_info(url, download=False)
-        if "entries" in info and info["entries"]:
-            return [entry["url"] for entry in info["entries"] if "url" in entry]
-    return []
+    return [entry['url'] for entry in get_playlist_cache().get_entries(url, youtube=False)]
 
 def get_youtube_playlist_videos(playlist_url):
     """Extract video URLs from a YouTube playlist."""
-    with yt_dlp.YoutubeDL(EXTRACT_OPTS) as ydl:
-        info = ydl.extract_info(playlist_url, download=False)
-        if "entries" in info and info["entries"]:
-            return [f"https://www.youtube.com/watch?v={entry['id']}" for entry in info["entries"]]
-    return []
+    return [entry['url'] for entry in get_playlist_cache().get_entries(playlist_url, youtube=True)]
+
+def get_playlist_durations(playlist_url):
+    """Track durations by URL from the stored enumeration of a playlist, where the site reported them."""
+    cached = get_playlist_cache().load(playlist_url) or {}
+    return {e['url']: e['duration'] for e in cached.get('entries', []) if e.get('duration')}
+
+def input_durations(inputs):
+    """Track durations by URL for every playlist among a run's inputs."""
+    durations = {}
+    for item in inputs:
+        if re.match(r'https?://', item):
+            durations.update(get_playlist_durations(item))
+    return durations
 
 def get_single_track_info(url):
     """Wrap single track URL in list format for uniform processing."""
     return [url]
 
-def download_track(url, out_path):
-    """Download audio track with YouTube fallback for region-locked content."""
+def resolve_url(url):
+    """Expand a track or playlist link into track URLs.
+
+    Returns (urls, single_track), or None when the link is not a supported
+    YouTube/SoundCloud track or playlist.
+    """
+    if is_youtube_track(url) or is_soundcloud_track(url):
+        logger.info("Detected single track")
+        return get_single_track_info(url), True
+    if is_soundcloud_playlist(url):
+        with trace_span('playlist', source='soundcloud') as span:
+            urls = get_soundcloud_playlist_tracks(url)
+            span['entries'] = len(urls)
+        logger.info(f"Detected SoundCloud playlist with {len(urls)} tracks")
+        return dedupe_urls(urls), False
+    if is_youtube_playlist(url):
+        with trace_span('playlist', source='youtube') as span:
+            urls = get_youtube_playlist_videos(url)
+            span['entries'] = len(urls)
+        logger.info(f"Detected YouTube playlist with {len(urls)} tracks")
+        return dedupe_urls(urls), False
+    return None
+
+_download_progress = threading.local()
+
+class DownloadCancelled(Exception):
+    """Raised from the progress hook to abort a download in flight."""
+
+def _ydl_progress_hook(d):
+    """Forward yt-dlp progress to the callback registered by the calling thread."""
+    cancel_flag = getattr(_download_progress, 'cancel_flag', None)
+    if cancel_flag is not None and cancel_flag.is_set():
+        raise DownloadCancelled()
+    if d.get('status') == 'downloading' and getattr(_download_progress, 'first_byte', 0) is None:
+        _download_progress.first_byte = time.perf_counter()
+    callback = getattr(_download_progress, 'callback', None)
+    if not callback:
+        return
+    if d.get('status') == 'downloading':
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        if total:
+            callback(min(1.0, d.get('downloaded_bytes', 0) / total))
+    elif d.get('status') == 'finished':
+        callback(1.0)
+
+def host_key(url):
+    """The site a URL belongs to, for rate limiting (www.youtube.com and youtu.be are both youtube.com)."""
+    host = urllib.parse.urlparse(url).netloc.lower().split(':')[0]
+    if host == "youtu.be":
+        return "youtube.com"
+    return '.'.join(host.split('.')[-2:])
+
+class HostRateLimiter:
+    """Token bucket per host, so requests go out at a steady pace instead of in bursts that get throttled.
+
+    When a host answers with 429 or similar, penalize() holds back every
+    worker's next request to it, not only the one that was refused.
+    """
+
+    def __init__(self, limits=None, default=DEFAULT_HOST_RATE_LIMIT):
+        self.limits = HOST_RATE_LIMITS if limits is None else limits
+        self.default = default
+        self._buckets = {}  # host -> [tokens, last refill, blocked until]
+        self._lock = threading.Lock()
+
+    def acquire(self, url, cancel_flag=None):
+        """Wait for a request slot on url's host; returns False if cancelled while waiting."""
+        host = host_key(url)
+        rate, burst = self.limits.get(host, self.default)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                bucket = self._buckets.setdefault(host, [float(burst), now, 0.0])
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                if bucket[0] >= 1 and now >= bucket[2]:
+                    bucket[0] -= 1
+                    return True
+                wait = max((1 - bucket[0]) / rate, bucket[2] - now)
+            if cancel_flag is not None:
+                if cancel_flag.wait(min(wait, 0.5)):
+                    return False
+            else:
+                time.sleep(min(wait, 0.5))
+
+    def penalize(self, url, seconds):
+        """Hold back all requests to url's host for the given number of seconds."""
+        with self._lock:
+            bucket = self._buckets.setdefault(host_key(url), [0.0, time.monotonic(), 0.0])
+            bucket[2] = max(bucket[2], time.monotonic() + seconds)
+
+_host_limiter = HostRateLimiter()
+
+def classify_download_error(error):
+    """Decide whether a failed download is worth retrying.
+
+    Returns (retryable, retry_after), where retry_after is the delay the
+    server asked for (seconds) or None. Errors that are not recognised are
+    treated as fatal, so a track that can never work is not hammered.
+    """
+    cause = error
+    exc_info = getattr(error, 'exc_info', None)  # yt-dlp wraps the underlying error
+    if exc_info and len(exc_info) > 1 and exc_info[1] is not None:
+        cause = exc_info[1]
+    status = getattr(cause, 'status', None) or getattr(cause, 'code', None)
+    if not isinstance(status, int):
+        match = re.search(r'HTTP Error (\d{3})', str(error))
+        status = int(match.group(1)) if match else None
+    retry_after = None
+    headers = getattr(getattr(cause, 'response', None), 'headers', None) or getattr(cause, 'headers', None)
+    if headers:
+        try:
+            retry_after = min(float(headers.get('Retry-After')), RETRY_MAX_DELAY)
+        except (TypeError, ValueError):
+            pass
+    if status is not None:
+        return status in RETRYABLE_HTTP_STATUS, retry_after
+
+    message = str(error).lower()
+    fatal = ('video unavailable', 'private video', 'has been removed', 'not available in your country',
+             'confirm your age', 'members-only', 'copyright', 'unsupported url', 'requested format is not available')
+    if any(text in message for text in fatal):
+        return False, None
+    if isinstance(cause, (TimeoutError, ConnectionError)):
+        return True, None
+    transient = ('timed out', 'timeout', 'too many requests', 'connection reset', 'connection aborted',
+                 'connection refused', 'remote end closed', 'temporary failure', 'name resolution',
+                 'network is unreachable', 'incompleteread', 'incomplete read', 'eof occurred', 'unable to download webpage')
+    return any(text in message for text in transient), retry_after
+
+def retry_delay(attempt, retry_after=None):
+    """Exponential backoff with jitter for the given retry (0 = first), never shorter than retry_after."""
+    ceiling = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+    return max(retry_after or 0.0, ceiling / 2 + random.uniform(0, ceiling / 2))
+
+def last_download_retryable():
+    """True when the calling thread's last failed download_track() failed with a temporary error."""
+    return getattr(_download_progress, 'retryable', False)
+
+def set_ydl_outtmpl(ydl, template):
+    """Point an existing YoutubeDL session at a new output template."""
+    outtmpl = ydl.params.get('outtmpl')
+    if isinstance(outtmpl, dict):
+        ydl.params['outtmpl'] = {**outtmpl, 'default': template}
+    else:
+        ydl.params['outtmpl'] = template
+    if hasattr(ydl, 'outtmpl_dict'):
+        # Older yt-dlp versions keep a parsed copy of the template
+        ydl.outtmpl_dict = ydl.parse_outtmpl()
+
+class YoutubeDLPool:
+    """Long-lived YoutubeDL sessions, one per worker thread.
+
+    Reusing a session keeps extractor state, cookies and keep-alive HTTP
+    connections between tracks; only the output path changes per download.
+    """
+
+    def __init__(self, opts=None):
+        self.opts = {**(opts or DOWNLOAD_OPTS), 'progress_hooks': [_ydl_progress_hook]}
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def get(self, outtmpl=None):
+        """Return the calling thread's session, creating it on first use."""
+        ydl = getattr(self._local, 'ydl', None)
+        if ydl is None:
+            ydl = load_yt_dlp().YoutubeDL(self.opts)
+            self._local.ydl = ydl
+            with self._lock:
+                self._sessions.append(ydl)
+        if outtmpl:
+            set_ydl_outtmpl(ydl, outtmpl)
+        return ydl
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for ydl in sessions:
+            try:
+                ydl.__exit__(None, None, None)
+            except Exception:
+                pass
+
+class TrackInfo:
+    """A downloaded track together with the metadata yt-dlp reported for it."""
+
+    def __init__(self, filepath, title, thumbnail=None, artist=None, genre=None, duration=None, url=None,
+                 stream_url=None, http_headers=None):
+        self.filepath = filepath
+        self.title = title
+        self.thumbnail = thumbnail
+        self.artist = artist
+        self.genre = genre
+        self.duration = duration
+        self.url = url
+        # Set instead of filepath when the audio is to be piped straight into FFmpeg
+        self.stream_url = stream_url
+        self.http_headers = http_headers or {}
+
+    @classmethod
+    def from_info(cls, info, filepath, url):
+        return cls(
+            filepath=filepath,
+            title=info.get('title') or (os.path.basename(filepath) if filepath else url),
+            thumbnail=info.get('thumbnail'),
+            artist=info.get('artist') or info.get('uploader'),
+            genre=info.get('genre'),
+            duration=info.get('duration'),
+            url=url,
+        )
+
+    def metadata(self):
+        """Tags to embed in the converted .ogg file."""
+        metadata = {'title': self.title, 'artist': self.artist, 'genre': self.genre}
+        if self.duration:
+            minutes = int(self.duration // 60)
+            seconds = int(self.duration % 60)
+            metadata['comment'] = f"Length: {minutes}:{seconds:02d}"
+        return metadata
+
+def is_region_locked_preview(info, url):
+    """Detect the 30 second previews SoundCloud serves for region-locked tracks."""
+    duration = info.get('duration')
+    return bool(duration and REGION_LOCK_MIN_DURATION < duration < REGION_LOCK_MAX_DURATION
+                and "soundcloud.com" in url.lower())
+
+def is_streamable(info):
+    """Check whether the selected format can be piped into FFmpeg without seeking."""
+    return (info.get('protocol') in ('http', 'https') and bool(info.get('url'))
+            and info.get('ext') in STREAMABLE_EXTS)
+
+def download_track(url, out_path, stream=False, pool=None, on_progress=None, cancel_flag=None,
+                   retries=DOWNLOAD_RETRIES, expected_duration=None):
+    """Download audio track with YouTube fallback for region-locked content.
+
+    With stream=True nothing is written when the format can be piped; the
+    returned TrackInfo then carries a stream_url instead of a filepath.
+    A YoutubeDLPool lets the calling worker reuse its session across tracks.
+    on_progress receives the downloaded fraction (0-1) as bytes arrive.
+    Setting cancel_flag aborts the transfer at the next chunk and removes
+    the partial file.
+    Requests are paced per host, and temporary errors (429, 5xx, timeouts)
+    are retried up to `retries` times with backoff. expected_duration, the
+    track's full length where the playlist listed it, ranks the YouTube
+    fallback for a region-locked preview.
+    Returns a TrackInfo, or None when the download failed; after a failure
+    last_download_retryable() tells whether trying later might still work.
+    """
+    _download_progress.retryable = False
+    for attempt in range(retries + 1):
+        if not _host_limiter.acquire(url, cancel_flag):
+            return None
+        try:
+            return _download_track(url, out_path, stream, pool, on_progress, cancel_flag, attempt, expected_duration)
+        except Exception as e:
+            retryable, retry_after = classify_download_error(e)
+            if not retryable or attempt == retries:
+                logger.error(f"Download failed for {url}: {e}")
+                _download_progress.retryable = retryable
+                return None
+            delay = retry_delay(attempt, retry_after)
+            if retry_after:
+                _host_limiter.penalize(url, delay)
+            logger.warning(f"Download failed for {url} ({e}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            if cancel_flag is not None and cancel_flag.wait(delay):
+                return None
+            if cancel_flag is None:
+                time.sleep(delay)
+
+def _download_track(url, out_path, stream, pool, on_progress, cancel_flag, attempt=0, expected_duration=None):
+    """One download attempt; raises on errors worth classifying, returns None for other failures."""
+    _download_progress.callback = on_progress
+    _download_progress.cancel_flag = cancel_flag
+    temp_download_path = None
+    started = time.perf_counter()
+    _download_progress.first_byte = None
     try:
         logger.info(f"Starting download: {url}")
         
@@ -224,27 +1051,47 @@ def download_track(url, out_path):
         
         temp_download_path = os.path.join(download_temp_dir, os.path.basename(out_path))
         
-        ydl_opts = {
-            **DOWNLOAD_OPTS,
-            'outtmpl': temp_download_path + '.%(ext)s',
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
+        outtmpl = temp_download_path + '.%(ext)s'
+        if pool:
+            ydl = pool.get(outtmpl)
+        else:
+            ydl = load_yt_dlp().YoutubeDL({**DOWNLOAD_OPTS, 'outtmpl': outtmpl, 'progress_hooks': [_ydl_progress_hook]})
+        with (contextlib.nullcontext(ydl) if pool else ydl):
+            info = ydl.extract_info(url, download=not stream)
             if 'entries' in info:
                 info = info['entries'][0]
+            if stream and not is_region_locked_preview(info, url):
+                if is_streamable(info):
+                    track = TrackInfo.from_info(info, None, url)
+                    track.stream_url = info['url']
+                    track.http_headers = info.get('http_headers') or {}
+                    trace_record('metadata', time.perf_counter() - started, source=get_source_id(url))
+                    logger.info(f"Streaming without intermediate file: {track.title}")
+                    return track
+                # The container needs seeking, so it has to go through a file after all
+                info = ydl.process_ie_result(info, download=True)
             filepath = ydl.prepare_filename(info)
-            thumbnail = info.get('thumbnail')
         
-        title = info.get('title') or os.path.basename(filepath)
+        # yt-dlp fetches metadata and media in one call; the first progress report splits the two
+        finished = time.perf_counter()
+        first_byte = _download_progress.first_byte or finished
+        trace_record('metadata', first_byte - started, source=get_source_id(url))
+        trace_record('download', finished - first_byte, source=get_source_id(url),
+                     bytes=os.path.getsize(filepath) if os.path.exists(filepath) else None)
+        track = TrackInfo.from_info(info, filepath, url)
+        title = track.title
         
         # Detect region-locked SoundCloud previews by duration
-        duration = info.get('duration')
-        if duration and REGION_LOCK_MIN_DURATION < duration < REGION_LOCK_MAX_DURATION and "soundcloud.com" in url.lower():
-            logger.warning(f"Region-locked preview detected (duration: {duration}s): {title}")
+        if is_region_locked_preview(info, url):
+            logger.warning(f"Region-locked preview detected (duration: {info.get('duration')}s): {title}")
             
             # Attempt YouTube fallback for region-locked content
             logger.info(f"Attempting YouTube fallback for: {title}")
-            youtube_url = search_youtube_fallback(title, info.get('uploader'))
+            if expected_duration and REGION_LOCK_MIN_DURATION < expected_duration < REGION_LOCK_MAX_DURATION:
+                expected_duration = None  # The playlist only knew the preview's length
+            with trace_span('fallback_search') as span:
+                youtube_url = search_youtube_fallback(title, info.get('uploader'), expected_duration)
+                span['found'] = bool(youtube_url)
             if youtube_url:
                 logger.info(f"Found YouTube alternative: {youtube_url}")
                 try:
@@ -252,20 +1099,127 @@ def download_track(url, out_path):
                         os.remove(filepath)
                 except:
                     pass
-                return download_track(youtube_url, out_path)
+                return download_track(youtube_url, out_path, stream, pool, on_progress, cancel_flag)
             else:
                 logger.warning(f"No YouTube fallback found for: {title}")
-                return None, None, None
+                return None
         logger.info(f"Successfully downloaded: {title}")
-        return filepath, title, thumbnail
+        return track
     except Exception as e:
-        logger.error(f"Download failed for {url}: {e}")
-        return None, None, None
+        if temp_download_path:
+            discard_partial_files(*glob.glob(glob.escape(temp_download_path) + '.*'))
+        if cancel_flag is not None and cancel_flag.is_set():
+            logger.info(f"Download cancelled: {url}")
+            return None
+        trace_record('download', time.perf_counter() - started, source=get_source_id(url), ok=False,
+                     error=str(e)[:200], attempt=attempt + 1)
+        raise
+    finally:
+        _download_progress.callback = None
+        _download_progress.cancel_flag = None
+
+class FallbackSearchCache:
+    """Persistent record of fallback search outcomes per (title, uploader).
+
+    Misses are remembered too, but for a shorter time, since a matching upload
+    may appear later.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'fallback_search.json')
+        self._lock = threading.Lock()
+        self._data = load_json_file(self.path, {})
 
-def search_youtube_fallback(title, artist=None):
-    """Search YouTube for alternative version of region-locked track."""
+    @staticmethod
+    def make_key(title, artist):
+        return f"{(title or '').strip().lower()}\x1f{(artist or '').strip().lower()}"
+
+    def get(self, title, artist):
+        """Return (found, url); found is False when there is no fresh entry."""
+        with self._lock:
+            entry = self._data.get(self.make_key(title, artist))
+        if not entry:
+            return False, None
+        ttl = FALLBACK_CACHE_TTL if entry.get('url') else FALLBACK_NEGATIVE_CACHE_TTL
+        if time.time() - entry.get('at', 0) > ttl:
+            return False, None
+        return True, entry.get('url')
+
+    def put(self, title, artist, url):
+        with self._lock:
+            self._data[self.make_key(title, artist)] = {'url': url, 'at': time.time()}
+            try:
+                write_json_atomic(self.path, self._data)
+            except OSError as e:
+                logger.warning(f"Could not save fallback search cache: {e}")
+
+_fallback_search_cache = None
+_fallback_search_cache_lock = threading.Lock()
+
+def get_fallback_search_cache():
+    """Return the shared fallback search cache, creating it on first use."""
+    global _fallback_search_cache
+    with _fallback_search_cache_lock:
+        if _fallback_search_cache is None:
+            _fallback_search_cache = FallbackSearchCache()
+        return _fallback_search_cache
+
+def _normalize_title(text):
+    text = re.sub(r'[\(\[].*?[\)\]]', ' ', (text or '').lower())
+    return ' '.join(re.findall(r'\w+', text))
+
+def score_fallback_candidate(entry, title, artist=None, expected_duration=None):
+    """Score a search result from 0 to 1 by how well it matches the original track."""
+    candidate = _normalize_title(entry.get('title'))
+    if not candidate:
+        return 0.0
+    wanted = _normalize_title(f"{artist} {title}" if artist else title)
+    title_only = _normalize_title(title)
+    wanted_tokens = set(title_only.split())
+    overlap = len(wanted_tokens & set(candidate.split())) / len(wanted_tokens) if wanted_tokens else 0.0
+    ratio = max(difflib.SequenceMatcher(None, wanted, candidate).ratio(),
+                difflib.SequenceMatcher(None, title_only, candidate).ratio())
+    score = 0.6 * overlap + 0.4 * ratio
+
+    duration = entry.get('duration')
+    if duration and expected_duration:
+        closeness = max(0.0, 1.0 - abs(duration - expected_duration) / max(expected_duration, 30))
+        score = 0.7 * score + 0.3 * closeness
+    elif duration:
+        # Without a reference length, distrust previews/shorts and hour-long compilations
+        if duration < FALLBACK_MIN_DURATION:
+            score *= 0.5
+        elif duration > FALLBACK_MAX_DURATION:
+            score *= 0.7
+    return score
+
+def _run_fallback_query(query):
+    """Run one YouTube search on its own YoutubeDL instance (they are not thread-safe)."""
+    # Remove common suffixes that might interfere with search
+    clean_query = re.sub(r'\s*\(.*?\)\s*$', '', query)
+    clean_query = re.sub(r'\s*\[.*?\]\s*$', '', clean_query)
+    logger.debug(f"Searching YouTube: {clean_query}")
+    _host_limiter.acquire("https://www.youtube.com/")
+    with load_yt_dlp().YoutubeDL(SEARCH_OPTS) as ydl:
+        search_results = ydl.extract_info(f"ytsearch{FALLBACK_RESULTS_PER_QUERY}:{clean_query}", download=False)
+    if search_results and 'entries' in search_results:
+        return [entry for entry in search_results['entries'] if entry and 'id' in entry]
+    return []
+
+def search_youtube_fallback(title, artist=None, expected_duration=None):
+    """Search YouTube for alternative version of region-locked track.
+
+    The query variants run concurrently and their results are ranked against
+    the original title, artist and (when known) duration. The search stops as
+    soon as a confident match arrives. Outcomes are cached per (title, artist).
+    """
     try:
         logger.info(f"Searching YouTube fallback for: {title} by {artist}")
+        cache = get_fallback_search_cache()
+        found, cached_url = cache.get(title, artist)
+        if found:
+            logger.info(f"Fallback search served from cache: {cached_url or 'no match'}")
+            return cached_url
         
         # Build search query variations for better match probability
         search_queries = []
@@ -285,67 +1239,309 @@ def search_youtube_fallback(title, artist=None):
             f"{title} song"
         ])
         
-        with yt_dlp.YoutubeDL(SEARCH_OPTS) as ydl:
-            for query in search_queries:
+        best_score, best_entry = 0.0, None
+        seen = set()
+        answered = False  # Whether any query returned candidates, so a miss is a real one
+        executor = ThreadPoolExecutor(max_workers=FALLBACK_SEARCH_WORKERS)
+        futures = {executor.submit(_run_fallback_query, query): query for query in search_queries}
+        try:
+            for future in as_completed(futures):
                 try:
-                    # Remove common suffixes that might interfere with search
-                    clean_query = re.sub(r'\s*\(.*?\)\s*$', '', query)
-                    clean_query = re.sub(r'\s*\[.*?\]\s*$', '', clean_query)
-                    
-                    logger.debug(f"Searching YouTube: {clean_query}")
-                    search_url = f"ytsearch3:{clean_query}"
-                    
-                    search_results = ydl.extract_info(search_url, download=False)
-                    
-                    if search_results and 'entries' in search_results:
-                        for entry in search_results['entries']:
-                            if entry and 'id' in entry:
-                                video_id = entry['id']
-                                youtube_url = f"https://www.youtube.com/watch?v={video_id}"
-                                video_title = entry.get('title', 'Unknown')
-                                logger.info(f"Found YouTube match: {video_title}")
-                                return youtube_url
-                    
+                    entries = future.result()
                 except Exception as e:
-                    logger.debug(f"Search failed for '{query}': {e}")
+                    logger.debug(f"Search failed for '{futures[future]}': {e}")
                     continue
+                answered = answered or bool(entries)
+                for entry in entries:
+                    if entry['id'] in seen:
+                        continue
+                    seen.add(entry['id'])
+                    score = score_fallback_candidate(entry, title, artist, expected_duration)
+                    if score > best_score:
+                        best_score, best_entry = score, entry
+                if best_score >= FALLBACK_CONFIDENT_SCORE:
+                    break
+        finally:
+            # Queries that have not started yet are dropped; running ones finish in the background
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+        
+        if best_entry and best_score >= FALLBACK_MIN_SCORE:
+            youtube_url = f"https://www.youtube.com/watch?v={best_entry['id']}"
+            logger.info(f"Found YouTube match: {best_entry.get('title', 'Unknown')} (score {best_score:.2f})")
+            cache.put(title, artist, youtube_url)
+            return youtube_url
         
         logger.warning(f"No YouTube fallback found for: {title} by {artist}")
+        if answered:
+            cache.put(title, artist, None)
         return None
         
     except Exception as e:
         logger.error(f"YouTube fallback search failed: {e}")
         return None
 
-def build_ffmpeg_command(filepath, out_path, high_quality, normalize_audio, mono_audio, metadata=None):
-    """Construct FFmpeg command with quality and normalization settings."""
+def get_encoding_args(high_quality, normalize_audio, mono_audio, loudness=None, audio_format=None):
+    """Return the FFmpeg output arguments that determine the encoded audio.
+
+    loudness is a measurement from measure_loudness(); when given, loudnorm
+    runs in linear mode using it instead of normalizing dynamically.
+    audio_format (from a SizeBudget) replaces the fixed quality profiles.
+    """
     channel_count = '1' if mono_audio else STANDARD_QUALITY_CHANNELS
     sample_rate = HIGH_QUALITY_SAMPLE_RATE if mono_audio else (HIGH_QUALITY_SAMPLE_RATE if high_quality else STANDARD_QUALITY_SAMPLE_RATE)
-    if high_quality:
+    if audio_format:
+        audio_args = ['-ab', f'{audio_format.kbps}k', '-ac', str(audio_format.channels),
+                      '-ar', str(audio_format.sample_rate)]
+    elif high_quality:
         bitrate = HIGH_QUALITY_MONO_BITRATE if mono_audio else HIGH_QUALITY_BITRATE
         audio_args = ['-ab', bitrate, '-ac', channel_count, '-ar', sample_rate]
     else:
         audio_args = ['-ab', STANDARD_QUALITY_BITRATE, '-ac', channel_count, '-ar', sample_rate]
-    
+
+    args = ['-c:a', 'libvorbis']  # Force Vorbis codec
+    if normalize_audio:
+        loudnorm = f'loudnorm=I={NORMALIZATION_LOUDNESS}:LRA={NORMALIZATION_LRA}:TP={NORMALIZATION_TRUE_PEAK}'
+        if loudness:
+            loudnorm += (f":measured_I={loudness['input_i']}:measured_LRA={loudness['input_lra']}"
+                         f":measured_TP={loudness['input_tp']}:measured_thresh={loudness['input_thresh']}"
+                         f":offset={loudness['target_offset']}:linear=true")
+        args += ['-af', loudnorm]
+    return args + audio_args
+
+def build_ffmpeg_command(filepath, out_path, high_quality, normalize_audio, mono_audio, metadata=None, loudness=None,
+                         audio_format=None):
+    """Construct FFmpeg command with quality and normalization settings."""
     cmd = [
         FFMPEG_PATH,
         '-y',
         '-i', filepath,
         '-vn',  # Skip video streams
-        '-c:a', 'libvorbis',  # Force Vorbis codec
     ]
-    
-    if normalize_audio:
-        cmd += ['-af', f'loudnorm=I={NORMALIZATION_LOUDNESS}:LRA={NORMALIZATION_LRA}:TP={NORMALIZATION_TRUE_PEAK}']
+    cmd += get_encoding_args(high_quality, normalize_audio, mono_audio, loudness, audio_format)
 
     if metadata:
         for k, v in metadata.items():
             if v:
                 cmd += ['-metadata', f'{k}={v}']
     
-    cmd += [*audio_args, out_path]
+    cmd.append(out_path)
     return cmd
 
+AudioFormat = namedtuple('AudioFormat', ['kbps', 'channels', 'sample_rate'])
+
+def choose_audio_format(kbps, mono_audio=False):
+    """Pick the best channels/sample rate a bitrate can carry, clamped to what libvorbis accepts."""
+    ladder = BUDGET_MONO_LADDER if mono_audio else BUDGET_LADDER
+    cap = min(int((HIGH_QUALITY_MONO_BITRATE if mono_audio else HIGH_QUALITY_BITRATE).rstrip('k')), AUDIT_MAX_BITRATE)
+    for min_kbps, channels, sample_rate in ladder:
+        if kbps >= min_kbps:
+            return AudioFormat(min(int(kbps), cap), channels, sample_rate)
+    min_kbps, channels, sample_rate = ladder[-1]
+    return AudioFormat(min_kbps, channels, sample_rate)
+
+def parse_size(text):
+    """Parse a size such as '700M', '1.5G' or '800k' into bytes; plain numbers are megabytes."""
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?\s*$', str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {text}")
+    number, unit = match.groups()
+    scale = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, '': 1024 ** 2}[unit.lower()]
+    return int(float(number) * scale)
+
+def folder_track_bytes(folder):
+    """Total size of the trackN.ogg files already in a folder."""
+    total = 0
+    for f in os.listdir(folder):
+        if re.match(r'track\d+\.ogg$', f):
+            try:
+                total += os.path.getsize(os.path.join(folder, f))
+            except OSError:
+                pass
+    return total
+
+class SizeBudget:
+    """Chooses bitrate, sample rate and channels per track so a folder stays within a size limit.
+
+    With total_bytes, whatever is left of the folder budget is spread over the
+    remaining audio time, so every track gets about the same bitrate. Each
+    track reserves its share when it starts encoding and is charged its real
+    size when done, so savings and overshoot carry over to the tracks after
+    it. With per_track_bytes every track simply gets that much.
+    """
+
+    def __init__(self, total_bytes=None, per_track_bytes=None, mono_audio=False, track_count=0,
+                 used_bytes=0, durations=None):
+        self.total_bytes = total_bytes
+        self.per_track_bytes = per_track_bytes
+        self.mono_audio = mono_audio
+        self.track_count = track_count
+        self.used_bytes = used_bytes  # Tracks already in the folder count against the budget
+        self.durations = dict(durations or {})  # idx -> seconds, known before encoding
+        self._reserved = {}  # idx -> bytes
+        self._allocated = set()
+        self._lock = threading.Lock()
+
+    def _estimate_seconds(self):
+        known = [d for d in self.durations.values() if d]
+        return sum(known) / len(known) if known else BUDGET_DEFAULT_TRACK_SECONDS
+
+    def allocate(self, idx, duration=None):
+        """Return the AudioFormat for track idx and reserve its share of the budget."""
+        with self._lock:
+            duration = duration or self.durations.get(idx) or self._estimate_seconds()
+            self.durations[idx] = duration
+            if self.per_track_bytes:
+                kbps = self.per_track_bytes * 8 * BUDGET_SAFETY_MARGIN / duration / 1000
+            else:
+                pending = [i for i in self.durations if i not in self._allocated and i != idx]
+                unknown = max(0, self.track_count - len(self._allocated) - len(pending) - 1)
+                remaining_seconds = duration + sum(self.durations[i] or self._estimate_seconds() for i in pending) \
+                    + unknown * self._estimate_seconds()
+                available = self.total_bytes - self.used_bytes - sum(self._reserved.values())
+                kbps = max(0, available) * 8 * BUDGET_SAFETY_MARGIN / remaining_seconds / 1000
+            audio_format = choose_audio_format(kbps, self.mono_audio)
+            if audio_format.kbps > kbps:
+                logger.warning(f"Size budget too small for track {idx}: using the minimum {audio_format.kbps} kbps, "
+                               "the folder will end up over budget")
+            self._allocated.add(idx)
+            self._reserved[idx] = audio_format.kbps * 1000 / 8 * duration
+        logger.info(f"Track {idx}: {audio_format.kbps} kbps, {audio_format.sample_rate} Hz, "
+                    f"{audio_format.channels} ch for {duration:.0f}s (size budget)")
+        return audio_format
+
+    def settle(self, idx, actual_bytes=None):
+        """Replace track idx's reservation with its real size, or release it if the track failed."""
+        with self._lock:
+            self._reserved.pop(idx, None)
+            if actual_bytes:
+                self.used_bytes += actual_bytes
+            else:
+                self._allocated.discard(idx)
+                self.track_count = max(0, self.track_count - 1)
+                self.durations.pop(idx, None)
+
+    def describe(self):
+        if self.per_track_bytes:
+            return f"{self.per_track_bytes / (1024 * 1024):.1f}MB per track"
+        return f"{self.total_bytes / (1024 * 1024):.1f}MB per folder"
+
+def encoding_key(high_quality, normalize_audio, mono_audio, size_budget=False):
+    """Identify a run's encoding settings for the folder manifest.
+
+    Size-budgeted tracks each get their own bitrate, so they are recorded as
+    one setting and can be kept by a later budgeted sync.
+    """
+    if size_budget:
+        return ['size-budget', f'normalize={bool(normalize_audio)}', f'mono={bool(mono_audio)}']
+    return get_encoding_args(high_quality, normalize_audio, mono_audio)
+
+def probe_duration(filepath):
+    """Read a file's duration in seconds from FFmpeg's banner, or None."""
+    kwargs = {}
+    if sys.platform == "win32":
+        kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+    try:
+        result = subprocess.run([FFMPEG_PATH, '-hide_banner', '-i', filepath], stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, **kwargs)
+    except OSError as e:
+        logger.warning(f"Could not probe duration: {e}")
+        return None
+    return parse_ffmpeg_duration(result.stderr.decode('utf-8', errors='replace'))
+
+def parse_ffmpeg_duration(text):
+    """Return the first 'Duration: HH:MM:SS.ss' in FFmpeg output as seconds, or None."""
+    match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', text)
+    if not match:
+        return None
+    h, m, sec = match.groups()
+    return int(h) * 3600 + int(m) * 60 + float(sec)
+
+LOUDNESS_KEYS = ('input_i', 'input_lra', 'input_tp', 'input_thresh', 'target_offset')
+
+def measure_loudness(filepath, cancel_flag=None):
+    """Run loudnorm's analysis-only pass over a file and return its measurements.
+
+    Returns None when FFmpeg fails, is cancelled or the input is silent.
+    """
+    cmd = [
+        FFMPEG_PATH, '-hide_banner', '-nostats',
+        '-i', filepath,
+        '-vn',
+        '-af', f'loudnorm=I={NORMALIZATION_LOUDNESS}:LRA={NORMALIZATION_LRA}:TP={NORMALIZATION_TRUE_PEAK}:print_format=json',
+        '-f', 'null', '-',
+    ]
+    try:
+        returncode, stderr = run_ffmpeg(cmd, cancel_flag=cancel_flag)
+    except OSError as e:
+        logger.warning(f"Loudness analysis could not start: {e}")
+        return None
+    if cancel_flag is not None and cancel_flag.is_set():
+        return None
+    # Newer FFmpeg versions print their output summary after loudnorm's JSON block
+    blocks = re.findall(r'\{[^{}]*"input_i"[^{}]*\}', stderr)
+    if returncode != 0 or not blocks:
+        logger.warning(f"Loudness analysis failed (return code {returncode})")
+        return None
+    try:
+        data = json.loads(blocks[-1])
+        measured = {k: data[k] for k in LOUDNESS_KEYS}
+        if not all(abs(float(v)) != float('inf') for v in measured.values()):
+            return None
+    except (KeyError, ValueError):
+        return None
+    return measured
+
+class LoudnessCache:
+    """Persistent loudness measurements keyed by source, shared by every encoding setting."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'loudness.json')
+        self._lock = threading.Lock()
+        self._data = load_json_file(self.path, {})
+
+    def get(self, source_key):
+        with self._lock:
+            return self._data.get(source_key)
+
+    def put(self, source_key, measurement):
+        with self._lock:
+            self._data[source_key] = measurement
+            try:
+                write_json_atomic(self.path, self._data)
+            except OSError as e:
+                logger.warning(f"Could not save loudness cache: {e}")
+
+_loudness_cache = None
+_loudness_cache_lock = threading.Lock()
+
+def get_loudness_cache():
+    """Return the shared loudness cache, creating it on first use."""
+    global _loudness_cache
+    with _loudness_cache_lock:
+        if _loudness_cache is None:
+            _loudness_cache = LoudnessCache()
+        return _loudness_cache
+
+def get_loudness(filepath, source_key=None, cancel_flag=None):
+    """Return loudness measurements for a file, analysing it only on a cache miss."""
+    cache = get_loudness_cache()
+    if source_key is None:
+        source_key = f"file:{hash_file(filepath)}"
+    measurement = cache.get(source_key)
+    if measurement:
+        logger.debug("Loudness analysis served from cache")
+        return measurement
+    started = time.time()
+    with trace_span('loudness') as span:
+        measurement = measure_loudness(filepath, cancel_flag)
+        span['ok'] = measurement is not None
+    if measurement:
+        cache.put(source_key, measurement)
+        logger.info(f"Measured loudness in {time.time() - started:.1f}s: {measurement['input_i']} LUFS")
+    return measurement
+
 def create_safe_temp_file(filepath, idx):
     """Generate secure temporary file for audio conversion."""
     temp_files_dir = os.path.join(APP_TEMP_DIR, 'temp_files')
@@ -361,102 +1557,1323 @@ def create_safe_temp_file(filepath, idx):
     os.close(temp_fd)
     return temp_filepath
 
-def convert_track(filepath, idx, out_folder, high_quality=True, metadata=None, delete_original=True, normalize_audio=False, mono_audio=False):
-    try:
-        logger.info(f"Converting track {idx}: {format_file_size_with_extension(filepath)}")
-        logger.debug(f"FFmpeg path: {FFMPEG_PATH}")
-        logger.debug(f"FFmpeg exists: {os.path.exists(FFMPEG_PATH)}")
-        
-        if not os.path.isfile(filepath):
-            error_msg = f"Input file does not exist: {filepath}"
-            logger.error(error_msg)
-            return False, error_msg
-        
-        # Create secure temporary copy for processing
-        original_filepath = filepath
-        temp_filepath = create_safe_temp_file(filepath, idx)
-        
-        try:
-            shutil.copy2(filepath, temp_filepath)
-            filepath = temp_filepath
-            logger.debug(f"Created temp copy: {format_file_size_with_extension(temp_filepath)}")
-        except Exception as e:
-            logger.error(f"Failed to create temp copy: {e}")
-            if temp_filepath and os.path.exists(temp_filepath):
-                os.remove(temp_filepath)
-            return False, f"Failed to create temp copy: {e}"
-        
-        ext = ".ogg"
-        fname = f"track{idx}{ext}"
-        out_path = os.path.join(out_folder, fname)
-        
-        # Build FFmpeg command
-        cmd = build_ffmpeg_command(filepath, out_path, high_quality, normalize_audio, mono_audio, metadata)
-        
-        kwargs = {}
-        if sys.platform == "win32":
-            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
-        
-        logger.debug(f"FFmpeg command: {' '.join(cmd)}")
-        logger.debug(f"Input file: {format_file_size_with_extension(filepath)}")
-        logger.debug(f"Output file: {format_file_size_with_extension(out_path) if os.path.exists(out_path) else os.path.basename(out_path)}")
-        logger.debug(f"Input file exists: {os.path.exists(filepath)}")
-        logger.debug(f"Output directory exists: {os.path.exists(os.path.dirname(out_path))}")
-        
-        try:
-            proc = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace', **kwargs)
-            logger.debug(f"FFmpeg return code: {proc.returncode}")
-            logger.debug(f"FFmpeg stdout: {proc.stdout}")
-            logger.debug(f"FFmpeg stderr: {proc.stderr}")
-            
-            if proc.returncode != 0:
-                stderr_output = proc.stderr.strip() if proc.stderr else "No error message"
-                stdout_output = proc.stdout.strip() if proc.stdout else "No output"
-                error_msg = f"FFmpeg error (return code {proc.returncode}): {stderr_output}"
-                if stdout_output:
-                    error_msg += f" | stdout: {stdout_output}"
-                logger.error(error_msg)
-                logger.debug(f"FFmpeg command that failed: {' '.join(cmd)}")
-                return False, error_msg
-        except FileNotFoundError as e:
-            error_msg = f"FFmpeg executable not found at {FFMPEG_PATH}: {str(e)}"
-            logger.error(error_msg)
-            return False, error_msg
-        except Exception as e:
-            error_msg = f"FFmpeg execution error: {str(e)}"
-            logger.error(error_msg)
-            return False, error_msg
-        finally:
-            # Clean up temp file if we created one
-            if temp_filepath and os.path.exists(temp_filepath):
+def is_ffmpeg_safe_path(filepath):
+    """Check whether FFmpeg can be given this path directly.
+
+    Plain ASCII paths are always opened correctly; anything else (non-ASCII
+    names, a leading '-', or a 'name:' prefix FFmpeg would read as a protocol)
+    goes through a temporary link or copy instead.
+    """
+    try:
+        filepath.encode('ascii')
+    except UnicodeEncodeError:
+        return False
+    if not filepath.isprintable() or os.path.basename(filepath).startswith('-'):
+        return False
+    drive, rest = os.path.splitdrive(os.path.abspath(filepath))
+    return ':' not in rest
+
+def reflink_file(src, dst):
+    """Create a copy-on-write clone of src (Linux FICLONE). Returns False when unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    FICLONE = 0x40049409
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+class TempCopyStats:
+    """Counts how many input bytes were read in place instead of being copied."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bytes_saved = 0
+        self.bytes_copied = 0
+        self.files = 0
+
+    def record(self, size, copied):
+        with self._lock:
+            self.files += 1
+            if copied:
+                self.bytes_copied += size
+            else:
+                self.bytes_saved += size
+
+    def log_and_reset(self):
+        with self._lock:
+            if self.files:
+                logger.info(f"Conversion input: {self.bytes_saved / (1024 * 1024):.1f}MB read without a temp copy, "
+                            f"{self.bytes_copied / (1024 * 1024):.1f}MB copied ({self.files} files)")
+            self.bytes_saved = 0
+            self.bytes_copied = 0
+            self.files = 0
+
+temp_copy_stats = TempCopyStats()
+
+def prepare_ffmpeg_input(filepath, idx, force_copy=False):
+    """Return (input_path, temp_path) for FFmpeg, avoiding a full copy when possible.
+
+    The source is used directly when its path is safe; otherwise it is hard-linked
+    or reflinked to a safe temp name, and only copied as a last resort. temp_path
+    is None when no temp file was created.
+    """
+    size = os.path.getsize(filepath)
+    if not force_copy and is_ffmpeg_safe_path(filepath):
+        temp_copy_stats.record(size, copied=False)
+        return filepath, None
+
+    with trace_span('temp_copy', idx, bytes=size) as span:
+        temp_filepath = create_safe_temp_file(filepath, idx)
+        if not force_copy:
+            os.remove(temp_filepath)
+            try:
+                os.link(filepath, temp_filepath)
+                logger.debug(f"Hard-linked input: {format_file_size_with_extension(filepath)}")
+                temp_copy_stats.record(size, copied=False)
+                span['method'] = 'hardlink'
+                return temp_filepath, temp_filepath
+            except OSError:
+                pass
+            if reflink_file(filepath, temp_filepath):
+                logger.debug(f"Reflinked input: {format_file_size_with_extension(filepath)}")
+                temp_copy_stats.record(size, copied=False)
+                span['method'] = 'reflink'
+                return temp_filepath, temp_filepath
+
+        span['method'] = 'copy'
+        try:
+            shutil.copy2(filepath, temp_filepath)
+        except Exception:
+            if os.path.exists(temp_filepath):
+                os.remove(temp_filepath)
+            raise
+        logger.debug(f"Created temp copy: {format_file_size_with_extension(temp_filepath)}")
+        temp_copy_stats.record(size, copied=True)
+        return temp_filepath, temp_filepath
+
+def terminate_process(proc, timeout=CANCEL_KILL_TIMEOUT):
+    """Stop a child process, killing it if it does not exit within timeout seconds."""
+    if proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+def run_ffmpeg(cmd, duration=None, on_progress=None, stdin_feeder=None, cancel_flag=None):
+    """Run an FFmpeg command, reporting encode progress from its -progress output.
+
+    on_progress receives the encoded fraction (0-1) of the input; the input
+    duration is read from FFmpeg's own banner when not given. stdin_feeder, if
+    set, is called with the process's stdin on a background thread and must
+    close it when done. Setting cancel_flag terminates FFmpeg straight away
+    (killing it if it ignores that). Returns (returncode, stderr_text), where
+    stderr_text holds the last FFMPEG_LOG_LINES lines of FFmpeg's output.
+    """
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:]
+    kwargs = {}
+    if sys.platform == "win32":
+        kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if stdin_feeder else subprocess.DEVNULL,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+
+    stderr_lines = deque(maxlen=FFMPEG_LOG_LINES)
+    state = {'duration': duration}
+
+    def read_stderr():
+        for raw in proc.stderr:
+            line = raw.decode('utf-8', errors='replace')
+            stderr_lines.append(line)
+            if not state['duration']:
+                state['duration'] = parse_ffmpeg_duration(line)
+
+    def watch_cancel():
+        while proc.poll() is None:
+            if cancel_flag.wait(0.1):
+                terminate_process(proc)
+                return
+
+    threads = [threading.Thread(target=read_stderr, daemon=True)]
+    if cancel_flag is not None:
+        threads.append(threading.Thread(target=watch_cancel, daemon=True))
+    if stdin_feeder:
+        threads.append(threading.Thread(target=stdin_feeder, args=(proc.stdin,), daemon=True))
+    for t in threads:
+        t.start()
+
+    for raw in proc.stdout:
+        key, _, value = raw.decode('utf-8', errors='replace').strip().partition('=')
+        if not on_progress:
+            continue
+        if key in ('out_time_us', 'out_time_ms') and state['duration']:
+            # Both keys are in microseconds (out_time_ms is misnamed)
+            try:
+                on_progress(min(1.0, int(value) / 1e6 / state['duration']))
+            except ValueError:
+                pass
+        elif key == 'progress' and value == 'end':
+            on_progress(1.0)
+
+    returncode = proc.wait()
+    for t in threads:
+        t.join()
+    return returncode, ''.join(stderr_lines)
+
+def save_ffmpeg_log(name, cmd, stderr):
+    """Write the output of a failed FFmpeg run to logs/ffmpeg; returns the file's path or None."""
+    log_dir = os.path.join(APP_TEMP_DIR, 'logs', 'ffmpeg')
+    path = os.path.join(log_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{name}.log")
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(' '.join(cmd) + '\n\n' + stderr)
+    except OSError as e:
+        logger.warning(f"Could not save FFmpeg output: {e}")
+        return None
+    return path
+
+def ffmpeg_error_message(returncode, stderr, log_path=None):
+    """Short description of a failed FFmpeg run: its last lines of output and where the rest is."""
+    tail = '\n'.join(stderr.strip().splitlines()[-FFMPEG_ERROR_TAIL_LINES:]) or "No error message"
+    message = f"FFmpeg error (return code {returncode}): {tail}"
+    return f"{message}\nFull output: {log_path}" if log_path else message
+
+def discard_partial_files(*paths):
+    """Delete leftovers of an interrupted download or conversion, ignoring missing files."""
+    for path in paths:
+        if not path:
+            continue
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+                logger.debug(f"Removed partial file: {format_file_size_with_extension(path)}")
+        except OSError as e:
+            logger.warning(f"Could not remove partial file: {e}")
+
+def is_input_open_error(stderr_output):
+    """Check whether FFmpeg failed because it could not open its input path."""
+    markers = ("No such file or directory", "Invalid argument", "Protocol not found", "Permission denied")
+    lines = stderr_output.splitlines()
+    return bool(lines) and any(marker in lines[-1] for marker in markers)
+
+def convert_track(filepath, idx, out_folder, high_quality=True, metadata=None, delete_original=True, normalize_audio=False, mono_audio=False, source_key=None, on_progress=None, duration=None, cancel_flag=None, audio_format=None):
+    try:
+        logger.info(f"Converting track {idx}: {format_file_size_with_extension(filepath)}")
+        logger.debug(f"FFmpeg path: {FFMPEG_PATH}")
+        logger.debug(f"FFmpeg exists: {os.path.exists(FFMPEG_PATH)}")
+        
+        if not os.path.isfile(filepath):
+            error_msg = f"Input file does not exist: {filepath}"
+            logger.error(error_msg)
+            return False, error_msg
+        
+        original_filepath = filepath
+        ext = ".ogg"
+        fname = f"track{idx}{ext}"
+        out_path = os.path.join(out_folder, fname)
+        
+        # Read the source in place when possible; fall back to a temp copy only if FFmpeg can't open it
+        for force_copy in (False, True):
+            try:
+                filepath, temp_filepath = prepare_ffmpeg_input(original_filepath, idx, force_copy=force_copy)
+            except Exception as e:
+                logger.error(f"Failed to create temp copy: {e}")
+                return False, f"Failed to create temp copy: {e}"
+            
+            # Never write through an existing file: it may be a hard link into the conversion cache
+            if os.path.exists(out_path):
+                os.remove(out_path)
+
+            try:
+                loudness = None
+                if normalize_audio and TWO_PASS_NORMALIZATION:
+                    loudness = get_loudness(filepath, source_key or f"file:{hash_file(original_filepath)}", cancel_flag)
+
+                # Build FFmpeg command
+                cmd = build_ffmpeg_command(filepath, out_path, high_quality, normalize_audio, mono_audio, metadata, loudness,
+                                           audio_format)
+                
+                logger.debug(f"FFmpeg command: {' '.join(cmd)}")
+                logger.debug(f"Input file: {format_file_size_with_extension(filepath)}")
+                logger.debug(f"Output file: {os.path.basename(out_path)}")
+                logger.debug(f"Output directory exists: {os.path.exists(os.path.dirname(out_path))}")
+                
+                with trace_span('encode', idx, bytes=os.path.getsize(filepath), audio_seconds=duration) as span:
+                    returncode, stderr = run_ffmpeg(cmd, duration=duration, on_progress=on_progress, cancel_flag=cancel_flag)
+                    span['ok'] = returncode == 0
+                    span['output_bytes'] = os.path.getsize(out_path) if returncode == 0 and os.path.exists(out_path) else None
+                logger.debug(f"FFmpeg return code: {returncode}")
+                
+                if cancel_flag is not None and cancel_flag.is_set():
+                    discard_partial_files(out_path, original_filepath if delete_original else None)
+                    logger.info(f"Conversion of track {idx} cancelled")
+                    return False, "Cancelled"
+                if returncode != 0:
+                    stderr_output = stderr.strip() if stderr else "No error message"
+                    if not force_copy and temp_filepath is None and is_input_open_error(stderr_output):
+                        logger.warning("FFmpeg could not open the input in place, retrying with a temp copy")
+                        continue
+                    error_msg = ffmpeg_error_message(returncode, stderr_output,
+                                                     save_ffmpeg_log(f"track{idx}", cmd, stderr_output))
+                    logger.error(error_msg)
+                    return False, error_msg
+                break
+            except FileNotFoundError as e:
+                error_msg = f"FFmpeg executable not found at {FFMPEG_PATH}: {str(e)}"
+                logger.error(error_msg)
+                return False, error_msg
+            except Exception as e:
+                error_msg = f"FFmpeg execution error: {str(e)}"
+                logger.error(error_msg)
+                return False, error_msg
+            finally:
+                # Clean up temp file if we created one
+                if temp_filepath and os.path.exists(temp_filepath):
+                    try:
+                        os.remove(temp_filepath)
+                        logger.debug(f"Cleaned up temp file: {format_file_size_with_extension(temp_filepath)}")
+                    except Exception as e:
+                        logger.warning(f"Failed to clean up temp file {format_file_size_with_extension(temp_filepath)}: {e}")
+        
+        # Remove original file only if delete_original is True (for downloaded files)
+        if delete_original:
+            try:
+                os.remove(original_filepath)
+                logger.debug(f"Removed original file: {format_file_size_with_extension(original_filepath)}")
+            except Exception as e:
+                logger.warning(f"Failed to remove original file {format_file_size_with_extension(original_filepath)}: {e}")
+        else:
+            logger.debug(f"Preserving original file: {format_file_size_with_extension(original_filepath)}")
+            
+        logger.info(f"Successfully converted track {idx}")
+        return True, out_path
+    except Exception as e:
+        error_msg = f"Conversion error: {str(e)}"
+        logger.error(error_msg)
+        return False, error_msg
+
+class StreamDownloadError(Exception):
+    """The HTTP transfer behind a streaming conversion failed or ended early; the track should be downloaded instead."""
+
+def convert_stream(track, idx, out_folder, high_quality=True, metadata=None, normalize_audio=False, mono_audio=False, source_key=None, on_progress=None, cancel_flag=None, audio_format=None):
+    """Encode a track while it downloads by piping the HTTP stream into FFmpeg's stdin.
+
+    A stream can't be analysed before it is encoded, so two-pass normalization
+    is only used when the loudness of the source is already cached.
+    Raises StreamDownloadError when the transfer fails or delivers fewer
+    bytes than the server announced, since FFmpeg would accept the cut-off
+    input as a complete, shorter track.
+    """
+    import urllib.request
+    out_path = os.path.join(out_folder, f"track{idx}.ogg")
+    logger.info(f"Streaming conversion of track {idx}: {track.title}")
+    if os.path.exists(out_path):
+        os.remove(out_path)
+
+    loudness = None
+    if normalize_audio and TWO_PASS_NORMALIZATION and source_key:
+        loudness = get_loudness_cache().get(source_key)
+    cmd = build_ffmpeg_command('pipe:0', out_path, high_quality, normalize_audio, mono_audio, metadata, loudness,
+                               audio_format)
+    logger.debug(f"FFmpeg command: {' '.join(cmd)}")
+
+    streamed = {'bytes': 0, 'error': None}
+
+    def feed(stdin):
+        try:
+            request = urllib.request.Request(track.stream_url, headers=track.http_headers)
+            with urllib.request.urlopen(request, timeout=30) as response:
+                expected = response.headers.get('Content-Length')
+                for chunk in iter(lambda: response.read(STREAM_CHUNK_SIZE), b''):
+                    if cancel_flag is not None and cancel_flag.is_set():
+                        return
+                    stdin.write(chunk)
+                    streamed['bytes'] += len(chunk)
+                # read() returns b'' when the connection drops, just as at the real end
+                if expected and expected.isdigit() and streamed['bytes'] < int(expected):
+                    raise IOError(f"connection closed after {streamed['bytes']} of {expected} bytes")
+        except BrokenPipeError:
+            pass  # FFmpeg exited early; its return code says why
+        except Exception as e:
+            streamed['error'] = e
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
+
+    try:
+        with trace_span('stream_encode', idx, audio_seconds=track.duration) as span:
+            returncode, stderr = run_ffmpeg(cmd, duration=track.duration, on_progress=on_progress, stdin_feeder=feed,
+                                            cancel_flag=cancel_flag)
+            span['bytes'] = streamed['bytes']
+            span['ok'] = returncode == 0 and not streamed['error']
+    except FileNotFoundError as e:
+        error_msg = f"FFmpeg executable not found at {FFMPEG_PATH}: {str(e)}"
+        logger.error(error_msg)
+        return False, error_msg
+    stderr_output = stderr.strip()
+    logger.debug(f"FFmpeg return code: {returncode}")
+
+    if cancel_flag is not None and cancel_flag.is_set():
+        discard_partial_files(out_path)
+        logger.info(f"Streaming conversion of track {idx} cancelled")
+        return False, "Cancelled"
+    if streamed['error'] or returncode != 0:
+        discard_partial_files(out_path)
+        if streamed['error']:
+            raise StreamDownloadError(f"Stream download failed: {streamed['error']}")
+        error_msg = ffmpeg_error_message(returncode, stderr_output,
+                                         save_ffmpeg_log(f"track{idx}_stream", cmd, stderr_output))
+        logger.error(error_msg)
+        return False, error_msg
+
+    logger.info(f"Successfully converted track {idx} ({streamed['bytes'] / (1024 * 1024):.1f}MB streamed)")
+    return True, out_path
+
+TRACK_FILE_RE = re.compile(r'track(\d+)\.ogg$')
+
+class TrackSlotIndex:
+    """In-memory record of which trackN.ogg numbers an output folder uses.
+
+    The folder is listed once; reserve() then hands out numbers under a lock,
+    so concurrent producers never get the same one, and settle() marks them
+    used once their files exist. The folder is listed again when its mtime
+    shows a change the index didn't make (tracks deleted in Explorer, say),
+    or after invalidate() from code that rewrites it wholesale.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._taken = set()
+        self._highest = 0  # Highest number in _taken
+        self._reserved = set()
+        self._stale = True
+        self._mtime = None  # Folder mtime the index is known to match
+
+    def _path(self, number):
+        return os.path.join(self.folder, f"track{number}.ogg")
+
+    def _folder_mtime(self):
+        try:
+            return os.stat(self.folder).st_mtime_ns
+        except OSError:
+            return None
+
+    def _scan(self):
+        self._mtime = self._folder_mtime()
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            names = []
+        self._taken = {int(m.group(1)) for m in map(TRACK_FILE_RE.match, names) if m}
+        self._highest = max(self._taken, default=0)
+        self._stale = False
+
+    def _mark_taken(self, number):
+        self._taken.add(number)
+        self._highest = max(self._highest, number)
+
+    def invalidate(self):
+        with self._lock:
+            self._stale = True
+
+    def reserve(self, count=1, fill_gaps=False):
+        """Claim count unused track numbers, lowest first.
+
+        Without fill_gaps they all come after the highest number in use, so
+        new tracks go to the end; with it, numbers left free by deleted or
+        skipped tracks are reused first.
+        """
+        with self._lock:
+            if self._stale or self._folder_mtime() != self._mtime:
+                self._scan()
+            numbers = []
+            candidate = 1 if fill_gaps else max(self._highest, max(self._reserved, default=0)) + 1
+            while len(numbers) < count:
+                if candidate not in self._taken and candidate not in self._reserved:
+                    # Only the candidate is checked on disk, to notice tracks added by another program
+                    if os.path.exists(self._path(candidate)):
+                        self._mark_taken(candidate)
+                    else:
+                        numbers.append(candidate)
+                candidate += 1
+            self._reserved.update(numbers)
+            return numbers
+
+    def settle(self, numbers):
+        """End reservations: numbers whose file now exists become used, the rest are free again."""
+        with self._lock:
+            for number in numbers:
+                self._reserved.discard(number)
+                if os.path.exists(self._path(number)):
+                    self._mark_taken(number)
+            # The run's own writes are accounted for; only later outside changes should cause a rescan
+            if not self._stale:
+                self._mtime = self._folder_mtime()
+
+_slot_indexes = {}
+_slot_indexes_lock = threading.Lock()
+
+def get_slot_index(folder):
+    """Return the shared slot index of an output folder, creating it on first use."""
+    key = os.path.normcase(os.path.abspath(folder))
+    with _slot_indexes_lock:
+        if key not in _slot_indexes:
+            _slot_indexes[key] = TrackSlotIndex(key)
+        return _slot_indexes[key]
+
+class ConversionCache:
+    """Persistent, size-bounded cache of converted .ogg files.
+
+    Entries are keyed by the source identity (video ID or file hash) together
+    with the encoding arguments, and evicted least-recently-used first.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=CONVERSION_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir or os.path.join(CACHE_DIR, 'ogg')
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._dirty = False  # Access times changed since the index was last written
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._index = load_json_file(self.index_path, {})
+
+    @staticmethod
+    def make_key(source_identity, high_quality, normalize_audio, mono_audio, two_pass=TWO_PASS_NORMALIZATION):
+        """two_pass says whether normalization used a loudness measurement; single-pass output differs."""
+        encoding = get_encoding_args(high_quality, normalize_audio, mono_audio)
+        payload = json.dumps([source_identity, encoding, bool(normalize_audio and two_pass)])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.ogg")
+
+    def lookup(self, key):
+        """Return the cache entry for key, or None on a miss.
+
+        The new access time is only kept in memory; log_stats writes it out at the end of the run.
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry and os.path.isfile(self._entry_path(key)):
+                entry['last_used'] = time.time()
+                self.hits += 1
+                self._dirty = True
+                return dict(entry)
+            if entry:
+                del self._index[key]
+                self._dirty = True
+            self.misses += 1
+            return None
+
+    def restore(self, key, out_path):
+        """Place the cached file for key at out_path. Returns False if it has gone missing."""
+        try:
+            link_or_copy(self._entry_path(key), out_path)
+            return True
+        except OSError as e:
+            logger.warning(f"Could not restore cached track: {e}")
+            with self._lock:
+                self._index.pop(key, None)
+                self._save()
+            return False
+
+    def store(self, key, ogg_path, title=None, thumbnail=None):
+        """Add a freshly converted file to the cache."""
+        try:
+            link_or_copy(ogg_path, self._entry_path(key))
+            size = os.path.getsize(ogg_path)
+        except OSError as e:
+            logger.warning(f"Could not add track to conversion cache: {e}")
+            return
+        with self._lock:
+            self._index[key] = {
+                'size': size,
+                'last_used': time.time(),
+                'title': title,
+                'thumbnail': thumbnail,
+            }
+            self._evict()
+            self._save()
+
+    def _evict(self):
+        total = sum(e['size'] for e in self._index.values())
+        for key, entry in sorted(self._index.items(), key=lambda kv: kv[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+            total -= entry['size']
+            del self._index[key]
+
+    def _save(self):
+        try:
+            write_json_atomic(self.index_path, self._index)
+            self._dirty = False
+        except OSError as e:
+            logger.warning(f"Could not save conversion cache index: {e}")
+
+    def log_stats(self):
+        """Log this run's hit rate and write out access times that changed since the last save."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+            size = sum(e['size'] for e in self._index.values())
+            logger.info(f"Conversion cache: {self.hits} hits, {self.misses} misses, "
+                        f"{len(self._index)} entries ({size / (1024 * 1024):.1f}MB)")
+            self.hits = 0
+            self.misses = 0
+
+_conversion_cache = None
+_conversion_cache_lock = threading.Lock()
+
+def get_conversion_cache():
+    """Return the shared conversion cache, creating it on first use."""
+    global _conversion_cache
+    with _conversion_cache_lock:
+        if _conversion_cache is None:
+            _conversion_cache = ConversionCache()
+        return _conversion_cache
+
+class TempStorageManager:
+    """Keeps APP_TEMP_DIR from growing without limit.
+
+    Each subdirectory in TEMP_STORAGE_LIMITS loses files past its age limit,
+    then its least recently used files until it fits its quota. Files touched
+    within TEMP_GRACE_SECONDS are never removed, so a sweep can run while this
+    or another instance is converting.
+    """
+
+    def __init__(self, root=APP_TEMP_DIR, limits=None):
+        self.root = root
+        self.limits = TEMP_STORAGE_LIMITS if limits is None else limits
+        self.last_sweep = None  # {'at', 'files', 'bytes'} of the most recent sweep
+        self._lock = threading.Lock()
+
+    def _files(self, subdir):
+        """(path, size, last used) of every file below subdir."""
+        found = []
+        for dirpath, _, names in os.walk(os.path.join(self.root, subdir)):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((path, st.st_size, max(st.st_mtime, st.st_atime)))
+        return found
+
+    def sweep(self):
+        """Apply the age limits and quotas; returns the number of files and bytes removed."""
+        with self._lock:
+            started = time.time()
+            removed_files = removed_bytes = 0
+            for subdir, (max_bytes, max_age) in self.limits.items():
+                files = sorted(self._files(subdir), key=lambda f: f[2])
+                total = sum(size for _, size, _ in files)
+                for path, size, last_used in files:
+                    age = started - last_used
+                    expired = max_age is not None and age > max_age
+                    over_quota = max_bytes is not None and total > max_bytes
+                    # Oldest first, so once a file is kept every newer one is too
+                    if age < TEMP_GRACE_SECONDS or not (expired or over_quota):
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        logger.debug(f"Could not remove temp file {path}: {e}")
+                        continue
+                    total -= size
+                    removed_files += 1
+                    removed_bytes += size
+            self.last_sweep = {'at': started, 'files': removed_files, 'bytes': removed_bytes}
+        if removed_files:
+            logger.info(f"Temp storage: removed {removed_files} old files ({removed_bytes / (1024 * 1024):.1f}MB) "
+                        f"in {time.time() - started:.2f}s")
+        return removed_files, removed_bytes
+
+    def usage(self):
+        """Files and bytes per top-level entry of the temp directory, plus the last sweep."""
+        stats = {}
+        try:
+            entries = sorted(os.listdir(self.root))
+        except OSError:
+            entries = []
+        for name in entries:
+            if os.path.isdir(os.path.join(self.root, name)):
+                files = self._files(name)
+                stats[name] = {'files': len(files), 'bytes': sum(size for _, size, _ in files)}
+        limits = {name: {'max_bytes': max_bytes, 'max_age': max_age}
+                  for name, (max_bytes, max_age) in self.limits.items()}
+        return {'root': self.root, 'dirs': stats, 'total_bytes': sum(d['bytes'] for d in stats.values()),
+                'limits': limits, 'last_sweep': self.last_sweep}
+
+    def log_usage(self):
+        usage = self.usage()
+        parts = ', '.join(f"{name} {d['files']} files ({d['bytes'] / (1024 * 1024):.1f}MB)"
+                          for name, d in usage['dirs'].items())
+        logger.info(f"Temp storage: {usage['total_bytes'] / (1024 * 1024):.1f}MB in {self.root}" + (f": {parts}" if parts else ""))
+
+_temp_storage = None
+_temp_storage_lock = threading.Lock()
+
+def get_temp_storage():
+    """Return the shared temp storage manager, creating it on first use."""
+    global _temp_storage
+    with _temp_storage_lock:
+        if _temp_storage is None:
+            _temp_storage = TempStorageManager()
+        return _temp_storage
+
+def sweep_temp_storage():
+    """Clean up the temp directory and log what it holds; safe to run in the background."""
+    storage = get_temp_storage()
+    try:
+        storage.sweep()
+        storage.log_usage()
+    except Exception as e:
+        logger.warning(f"Temp storage cleanup failed: {e}")
+
+def audio_fingerprint(filepath, cancel_flag=None):
+    """Describe how a track's energy moves through a few frequency bands over time.
+
+    Returns one list of dB values per band (one value per FINGERPRINT_BLOCK
+    seconds), or None when the file can't be decoded. Re-encoding, volume
+    changes and resampling barely change it, so reuploads of a song match.
+    """
+    bands = len(FINGERPRINT_BANDS)
+    graph = (f"[0:a]aresample={FINGERPRINT_SAMPLE_RATE},aformat=channel_layouts=mono,asplit={bands}"
+             + ''.join(f"[s{i}]" for i in range(bands)) + ';'
+             + ''.join(f"[s{i}]{band}[b{i}];" for i, band in enumerate(FINGERPRINT_BANDS))
+             + ''.join(f"[b{i}]" for i in range(bands)) + f"amerge=inputs={bands}[out]")
+    os.makedirs(os.path.join(APP_TEMP_DIR, 'temp_files'), exist_ok=True)
+    temp_fd, raw_path = tempfile.mkstemp(suffix='.raw', dir=os.path.join(APP_TEMP_DIR, 'temp_files'))
+    os.close(temp_fd)
+    try:
+        cmd = [FFMPEG_PATH, '-hide_banner', '-y', '-t', str(FINGERPRINT_SECONDS), '-i', filepath,
+               '-filter_complex', graph, '-map', '[out]', '-f', 's16le', raw_path]
+        try:
+            returncode, _ = run_ffmpeg(cmd, cancel_flag=cancel_flag)
+        except OSError as e:
+            logger.warning(f"Fingerprinting could not start: {e}")
+            return None
+        if returncode != 0 or (cancel_flag is not None and cancel_flag.is_set()):
+            return None
+        samples = array.array('h')
+        with open(raw_path, 'rb') as f:
+            data = f.read()
+        samples.frombytes(data[:len(data) - len(data) % 2])
+    finally:
+        discard_partial_files(raw_path)
+    if sys.byteorder == 'big':
+        samples.byteswap()
+
+    step = int(FINGERPRINT_SAMPLE_RATE * FINGERPRINT_BLOCK) * bands
+    fingerprint = [[] for _ in range(bands)]
+    for start in range(0, len(samples) - step + 1, step):
+        block = samples[start:start + step]
+        for band in range(bands):
+            values = block[band::bands]
+            energy = sum(v * v for v in values) / len(values)
+            fingerprint[band].append(round(10 * math.log10(energy + 1), 1))
+    return fingerprint if fingerprint[0] else None
+
+def _correlation(a, b):
+    n = len(a)
+    mean_a, mean_b = sum(a) / n, sum(b) / n
+    var_a = sum((x - mean_a) ** 2 for x in a)
+    var_b = sum((y - mean_b) ** 2 for y in b)
+    if var_a < 1e-9 or var_b < 1e-9:
+        return 0.0
+    return sum((x - mean_a) * (y - mean_b) for x, y in zip(a, b)) / math.sqrt(var_a * var_b)
+
+def fingerprint_similarity(first, second):
+    """Best average band correlation (0-1) of two fingerprints over the allowed time offsets."""
+    max_offset = int(FINGERPRINT_MAX_OFFSET / FINGERPRINT_BLOCK)
+    min_overlap = int(10 / FINGERPRINT_BLOCK)
+    best = 0.0
+    for offset in range(-max_offset, max_offset + 1):
+        scores = []
+        for a, b in zip(first, second):
+            a, b = (a[offset:], b) if offset >= 0 else (a, b[-offset:])
+            n = min(len(a), len(b))
+            if n < min_overlap:
+                break
+            scores.append(_correlation(a[:n], b[:n]))
+        if len(scores) == len(first):
+            best = max(best, sum(scores) / len(scores))
+    return best
+
+class DuplicateDetector:
+    """Spots tracks in a run that are another upload of a track already kept.
+
+    Each track is fingerprinted before it is encoded and compared with the
+    kept tracks of about the same length; the first copy to reach
+    conversion is the one that is kept.
+    """
+
+    def __init__(self, policy=DUPLICATE_POLICY):
+        self.policy = policy
+        self._kept = []  # [(idx, duration, fingerprint), ...]
+        self._lock = threading.Lock()
+
+    def check(self, idx, filepath, duration=None, cancel_flag=None):
+        """Return the track number idx duplicates, or None after remembering idx as kept."""
+        with trace_span('fingerprint') as span:
+            fingerprint = audio_fingerprint(filepath, cancel_flag)
+            span['ok'] = fingerprint is not None
+        if fingerprint is None:
+            return None
+        # Compare outside the lock so workers don't wait on each other; tracks kept in the
+        # meantime are compared on the next round before this one is added
+        compared = 0
+        while True:
+            with self._lock:
+                candidates = self._kept[compared:]
+                if not candidates:
+                    self._kept.append((idx, duration, fingerprint))
+                    return None
+                compared = len(self._kept)
+            for kept_idx, kept_duration, kept_fingerprint in candidates:
+                if duration and kept_duration and abs(duration - kept_duration) > FINGERPRINT_MAX_LENGTH_DIFF:
+                    continue
+                score = fingerprint_similarity(fingerprint, kept_fingerprint)
+                if score >= FINGERPRINT_MATCH:
+                    logger.info(f"Track {idx} sounds the same as track {kept_idx} (similarity {score:.2f})")
+                    return kept_idx
+
+    def forget(self, idx):
+        """Stop treating track idx as kept, after its conversion failed."""
+        with self._lock:
+            self._kept = [kept for kept in self._kept if kept[0] != idx]
+
+def convert_local_file(filepath, idx, out_folder, high_quality=True, normalize_audio=False, mono_audio=False, cache=None, on_progress=None, cancel_flag=None, budget=None):
+    """Convert a local audio file, reusing a cached conversion of identical content.
+
+    With a SizeBudget the format is chosen per file and the cache is not used.
+    """
+    with trace_track(idx):
+        if budget is None:
+            return _convert_local_file(filepath, idx, out_folder, high_quality, normalize_audio, mono_audio, cache,
+                                       on_progress, cancel_flag)
+        audio_format = budget.allocate(idx)
+        success, result = convert_track(filepath, idx, out_folder, high_quality, None, delete_original=False,
+                                        normalize_audio=normalize_audio, mono_audio=mono_audio,
+                                        on_progress=on_progress, duration=budget.durations.get(idx),
+                                        cancel_flag=cancel_flag, audio_format=audio_format)
+        budget.settle(idx, os.path.getsize(result) if success else None)
+        return success, result
+
+def _convert_local_file(filepath, idx, out_folder, high_quality, normalize_audio, mono_audio, cache,
+                        on_progress, cancel_flag):
+    key = None
+    source_key = None
+    if cache is not None:
+        try:
+            with trace_span('hash', bytes=os.path.getsize(filepath)):
+                source_key = f"file:{hash_file(filepath)}"
+            key = cache.make_key(source_key, high_quality, normalize_audio, mono_audio)
+        except OSError as e:
+            logger.warning(f"Could not hash {format_file_size_with_extension(filepath)}: {e}")
+        if key and cache.lookup(key):
+            out_path = os.path.join(out_folder, f"track{idx}.ogg")
+            with trace_span('cache_restore') as span:
+                span['ok'] = restored = cache.restore(key, out_path)
+            if restored:
+                logger.info(f"Track {idx} restored from conversion cache")
+                return True, out_path
+    success, result = convert_track(filepath, idx, out_folder, high_quality, None, delete_original=False,
+                                    normalize_audio=normalize_audio, mono_audio=mono_audio, source_key=source_key,
+                                    on_progress=on_progress, cancel_flag=cancel_flag)
+    if success and key:
+        cache.store(key, result, os.path.basename(filepath))
+    return success, result
+
+class ConversionScheduler:
+    """Run up to N FFmpeg conversions at the same time.
+
+    FFmpeg already runs in its own process, so one thread per slot is enough to
+    keep every core busy. A failing job is reported on its own and never stops
+    the others.
+    """
+
+    def __init__(self, max_workers=None, cancel_flag=None, on_job_start=None):
+        self.max_workers = max(1, max_workers or CONVERT_WORKERS)
+        self.cancel_flag = cancel_flag or threading.Event()
+        self.on_job_start = on_job_start
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._futures = []
+        logger.info(f"Conversion scheduler started with {self.max_workers} workers")
+
+    def submit(self, idx, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) as job idx; the future yields (idx, success, result)."""
+        future = self._executor.submit(self._run_job, idx, func, args, kwargs)
+        self._futures.append(future)
+        return future
+
+    def _run_job(self, idx, func, args, kwargs):
+        if self.cancel_flag.is_set():
+            return idx, False, "Cancelled"
+        if self.on_job_start:
+            self.on_job_start(idx)
+        try:
+            success, result = func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Conversion job {idx} failed unexpectedly: {e}")
+            return idx, False, f"Conversion error: {e}"
+        return idx, success, result
+
+    def results(self):
+        """Yield (idx, success, result) for every submitted job as it finishes."""
+        for future in as_completed(self._futures):
+            if future.cancelled():
+                continue
+            yield future.result()
+
+    def cancel(self):
+        """Drop queued jobs; jobs already running are left to finish."""
+        self.cancel_flag.set()
+        for future in self._futures:
+            future.cancel()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+class ProgressModel:
+    """Sub-track progress of a batch, with an ETA from measured throughput.
+
+    Each track moves through its stages (download, encode) with fractions
+    reported by yt-dlp and FFmpeg. Stages are weighted by how long they have
+    actually taken on finished tracks, and the ETA is the remaining work
+    divided by the rate progress advanced over the last ETA_WINDOW seconds.
+    """
+
+    ETA_WINDOW = 30.0
+
+    def __init__(self, total, stages=('download', 'encode')):
+        self.total = max(1, total)
+        self.stages = tuple(stages)
+        self._lock = threading.Lock()
+        self._fractions = {}  # idx -> {stage: fraction}
+        self._stage_started = {}  # (idx, stage) -> start time
+        self._stage_seconds = {stage: [0.0, 0] for stage in self.stages}  # total seconds, finished count
+        self._done = set()
+        self._started = time.time()
+        self._history = []  # (time, overall fraction)
+
+    def update(self, idx, stage, fraction):
+        now = time.time()
+        with self._lock:
+            if idx in self._done or stage not in self.stages:
+                return
+            fractions = self._fractions.setdefault(idx, {})
+            self._stage_started.setdefault((idx, stage), now)
+            fractions[stage] = max(fractions.get(stage, 0.0), min(1.0, fraction))
+            if fractions[stage] >= 1.0:
+                self._finish_stage(idx, stage, now)
+
+    def complete(self, idx):
+        """Mark a track as done, whether it succeeded, failed or came from a cache."""
+        now = time.time()
+        with self._lock:
+            for stage in self.stages:
+                self._finish_stage(idx, stage, now)
+            self._done.add(idx)
+            self._fractions.pop(idx, None)
+
+    def _finish_stage(self, idx, stage, now):
+        started = self._stage_started.pop((idx, stage), None)
+        if started is not None:
+            measured = self._stage_seconds[stage]
+            measured[0] += now - started
+            measured[1] += 1
+
+    def _weights(self):
+        averages = {}
+        for stage, (seconds, count) in self._stage_seconds.items():
+            if not count:
+                return {stage: 1.0 / len(self.stages) for stage in self.stages}
+            averages[stage] = seconds / count
+        total = sum(averages.values()) or 1.0
+        return {stage: avg / total for stage, avg in averages.items()}
+
+    def fraction(self):
+        """Overall completed fraction of the batch (0-1)."""
+        with self._lock:
+            weights = self._weights()
+            partial = sum(sum(weights[stage] * f for stage, f in fractions.items())
+                          for fractions in self._fractions.values())
+            return min(1.0, (len(self._done) + partial) / self.total)
+
+    def eta(self):
+        """Estimated seconds remaining, or None until progress has been measured."""
+        now = time.time()
+        current = self.fraction()
+        with self._lock:
+            self._history.append((now, current))
+            while len(self._history) > 2 and now - self._history[0][0] > self.ETA_WINDOW:
+                self._history.pop(0)
+            then, past = self._history[0]
+        if current >= 1.0:
+            return 0
+        if now - then >= 2.0 and current > past:
+            rate = (current - past) / (now - then)
+        elif current > 0:
+            rate = current / max(now - self._started, 1e-6)
+        else:
+            return None
+        return int((1.0 - current) / rate)
+
+TrackResult = namedtuple('TrackResult', ['idx', 'success', 'path', 'title', 'thumbnail', 'error', 'duplicate_of'],
+                         defaults=(None,))
+
+class TrackPipeline:
+    """Download tracks on a pool of workers and feed them to a pool of FFmpeg workers.
+
+    Every job carries its final track number, so the output folder ends up the
+    same no matter which worker finishes first.
+    """
+
+    def __init__(self, jobs, out_folder, high_quality=True, normalize_audio=False, mono_audio=False,
+                 cancel_flag=None, download_workers=DOWNLOAD_WORKERS,
+                 convert_workers=CONVERT_WORKERS, on_track_start=None, on_track_done=None, cache=None,
+                 manifest=None, stream=STREAMING_MODE, progress=None, budget=None, duplicates=None, durations=None):
+        self.jobs = list(jobs)  # [(track_idx, url), ...]
+        self.durations = durations or {}  # {url: seconds} from playlist enumeration, for fallback ranking
+        self.out_folder = out_folder
+        self.high_quality = high_quality
+        self.normalize_audio = normalize_audio
+        self.mono_audio = mono_audio
+        self.cancel_flag = cancel_flag or threading.Event()
+        self.download_workers = max(1, min(download_workers, len(self.jobs) or 1))
+        self.convert_workers = max(1, min(convert_workers, len(self.jobs) or 1))
+        self.on_track_start = on_track_start
+        self.on_track_done = on_track_done
+        self.cache = cache
+        self.manifest = manifest
+        self.stream = stream
+        self.budget = budget  # SizeBudget; replaces the cache, since budgeted formats differ per run
+        if budget is not None:
+            self.cache = None
+        self.duplicates = duplicates  # DuplicateDetector, or None to convert every track
+        self._held_duplicates = []  # Duplicates settled once the track they copy is done
+        self.ydl_pool = YoutubeDLPool()
+        self.progress = progress or ProgressModel(len(self.jobs))
+        self._urls = dict(self.jobs)
+        self._jobs_queue = queue.Queue()
+        self._retry_jobs = []  # Downloads that failed temporarily, tried once more at the end
+        self._final_pass = False
+        self._convert_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def run(self):
+        """Process all jobs and return their results ordered by track number."""
+        logger.info(f"Starting pipeline: {len(self.jobs)} tracks, {self.download_workers} download / {self.convert_workers} convert workers")
+        for job in self.jobs:
+            self._jobs_queue.put(job)
+
+        downloaders = [threading.Thread(target=self._download_worker, daemon=True) for _ in range(self.download_workers)]
+        converters = [threading.Thread(target=self._convert_worker, daemon=True) for _ in range(self.convert_workers)]
+        for t in downloaders + converters:
+            t.start()
+        for t in downloaders:
+            t.join()
+        if self._retry_jobs and not self.cancel_flag.is_set():
+            self._retry_failed_downloads()
+        for _ in converters:
+            self._convert_queue.put(None)
+        for t in converters:
+            t.join()
+        self.ydl_pool.close()
+        if not self.cancel_flag.is_set():
+            self._settle_duplicates()
+
+        if self.cache:
+            self.cache.log_stats()
+        temp_copy_stats.log_and_reset()
+        return [self._results[idx] for idx in sorted(self._results)]
+
+    def _retry_failed_downloads(self):
+        """Give temporarily failed downloads one more round, after letting throttled hosts recover."""
+        jobs, self._retry_jobs = sorted(self._retry_jobs), []
+        self._final_pass = True
+        logger.info(f"Retrying {len(jobs)} failed download(s) in {RETRY_QUEUE_DELAY:.0f}s")
+        if self.cancel_flag.wait(RETRY_QUEUE_DELAY):
+            for track_idx, _ in jobs:
+                self._finish(TrackResult(track_idx, False, None, None, None, None))
+            return
+        for job in jobs:
+            self._jobs_queue.put(job)
+        downloaders = [threading.Thread(target=self._download_worker, daemon=True)
+                       for _ in range(min(self.download_workers, len(jobs)))]
+        for t in downloaders:
+            t.start()
+        for t in downloaders:
+            t.join()
+
+    def _skip_duplicate(self, track_idx, original_idx, title, thumbnail):
+        if self.budget:
+            self.budget.settle(track_idx)
+        # Held until the end: the kept copy may still fail, and then this one must not count as done
+        with self._lock:
+            self._held_duplicates.append((track_idx, original_idx, title, thumbnail))
+
+    def _settle_duplicates(self):
+        for track_idx, original_idx, title, thumbnail in sorted(self._held_duplicates):
+            kept = self._results.get(original_idx)
+            if not (kept and kept.success):
+                logger.error(f"Track {track_idx} was skipped as a duplicate of track {original_idx}, which failed")
+                self._finish(TrackResult(track_idx, False, None, title, thumbnail,
+                                         f"Duplicate of track {original_idx}, which failed to convert", original_idx))
+                continue
+            if self.duplicates.policy != "link":
+                if self.manifest:
+                    self.manifest.record_duplicate(get_source_id(self._urls[track_idx]),
+                                                   get_source_id(self._urls[original_idx]))
+                self._finish(TrackResult(track_idx, False, None, title, thumbnail, None, original_idx))
+                continue
+            out_path = os.path.join(self.out_folder, f"track{track_idx}.ogg")
+            try:
+                link_or_copy(kept.path, out_path)
+            except OSError as e:
+                logger.error(f"Could not link duplicate track {track_idx}: {e}")
+                self._finish(TrackResult(track_idx, False, None, title, thumbnail,
+                                         f"Duplicate of track {original_idx}, which could not be used: {e}", original_idx))
+                continue
+            logger.info(f"Track {track_idx} linked to track {original_idx}")
+            self._finish(TrackResult(track_idx, True, out_path, title, thumbnail, None, original_idx))
+
+    def _finish(self, result):
+        if self.duplicates and not result.success and result.duplicate_of is None:
+            # Later copies of this track must be converted rather than matched against a missing file
+            self.duplicates.forget(result.idx)
+        self.progress.complete(result.idx)
+        if self.manifest and result.success:
+            self.manifest.record(result.idx, get_source_id(self._urls[result.idx]), result.title)
+        with self._lock:
+            self._results[result.idx] = result
+            completed = len(self._results)
+        if self.on_track_done:
+            self.on_track_done(result, completed)
+
+    def _download_worker(self):
+        while not self.cancel_flag.is_set():
+            try:
+                track_idx, url = self._jobs_queue.get_nowait()
+            except queue.Empty:
+                return
+            cache_key = None
+            with trace_track(track_idx):
+                if self.cache:
+                    cache_key = self.cache.make_key(get_source_id(url), self.high_quality, self.normalize_audio, self.mono_audio)
+                    if self._restore_cached(track_idx, cache_key):
+                        continue
+                track = download_track(url, os.path.join(self.out_folder, f"track{track_idx}"), stream=self.stream,
+                                       pool=self.ydl_pool,
+                                       on_progress=functools.partial(self.progress.update, track_idx, 'download'),
+                                       cancel_flag=self.cancel_flag, expected_duration=self.durations.get(url))
+            if not track:
+                if not self._final_pass and not self.cancel_flag.is_set() and last_download_retryable():
+                    with self._lock:
+                        self._retry_jobs.append((track_idx, url))
+                    continue
+                # download_track has already logged why; nothing to show the user
+                if self.budget:
+                    self.budget.settle(track_idx)
+                self._finish(TrackResult(track_idx, False, None, None, None, None))
+                continue
+            item = (track_idx, track, cache_key)
+            # Wait for room in the convert queue without ignoring a cancel request
+            while True:
+                try:
+                    self._convert_queue.put(item, timeout=0.2)
+                    break
+                except queue.Full:
+                    if self.cancel_flag.is_set():
+                        self._discard(track.filepath)
+                        return
+
+    def _convert_worker(self):
+        while True:
+            item = self._convert_queue.get()
+            if item is None:
+                return
+            track_idx, track, cache_key = item
+            if self.cancel_flag.is_set():
+                self._discard(track.filepath)
+                continue
+            with trace_track(track_idx):
                 try:
-                    os.remove(temp_filepath)
-                    logger.debug(f"Cleaned up temp file: {format_file_size_with_extension(temp_filepath)}")
+                    self._convert(track_idx, track, cache_key)
                 except Exception as e:
-                    logger.warning(f"Failed to clean up temp file {format_file_size_with_extension(temp_filepath)}: {e}")
-        
-        # Remove original file only if delete_original is True (for downloaded files)
-        if delete_original:
+                    # One bad track must not take the worker down, or the downloaders block on a full queue
+                    logger.error(f"Conversion of track {track_idx} failed unexpectedly: {e}")
+                    self._discard(track.filepath)
+                    self._fail(track_idx, track, f"Conversion error: {e}")
+
+    def _fail(self, track_idx, track, error):
+        """Record a track that raised instead of finishing, unless its result was already recorded."""
+        with self._lock:
+            if track_idx in self._results:
+                return
+        if self.budget:
+            self.budget.settle(track_idx)
+        try:
+            self._finish(TrackResult(track_idx, False, None, track.title, track.thumbnail, error))
+        except Exception as e:
+            logger.error(f"Could not record the failure of track {track_idx}: {e}")
+
+    def _convert(self, track_idx, track, cache_key):
+        if self.on_track_start:
+            self.on_track_start(track_idx, track.title or "Unknown")
+        if self.duplicates and not track.stream_url:
+            original_idx = self.duplicates.check(track_idx, track.filepath, track.duration, self.cancel_flag)
+            if original_idx is not None:
+                self._discard(track.filepath)
+                self._skip_duplicate(track_idx, original_idx, track.title, track.thumbnail)
+                return
+        source_key = get_source_id(self._urls[track_idx])
+        on_progress = functools.partial(self.progress.update, track_idx, 'encode')
+        audio_format = self.budget.allocate(track_idx, track.duration) if self.budget else None
+        if track.stream_url:
+            self.progress.update(track_idx, 'download', 1.0)
+            if cache_key and self.normalize_audio and not get_loudness_cache().get(source_key):
+                # Without a cached measurement the stream is normalized in a single pass
+                cache_key = self.cache.make_key(source_key, self.high_quality, self.normalize_audio, self.mono_audio,
+                                                two_pass=False)
             try:
-                os.remove(original_filepath)
-                logger.debug(f"Removed original file: {format_file_size_with_extension(original_filepath)}")
-            except Exception as e:
-                logger.warning(f"Failed to remove original file {format_file_size_with_extension(original_filepath)}: {e}")
+                success, result = convert_stream(track, track_idx, self.out_folder, self.high_quality, track.metadata(),
+                                                 normalize_audio=self.normalize_audio, mono_audio=self.mono_audio,
+                                                 source_key=source_key, on_progress=on_progress,
+                                                 cancel_flag=self.cancel_flag, audio_format=audio_format)
+            except StreamDownloadError as e:
+                logger.warning(f"{e}; downloading track {track_idx} to a file instead")
+                track = download_track(self._urls[track_idx], os.path.join(self.out_folder, f"track{track_idx}"),
+                                       pool=self.ydl_pool, cancel_flag=self.cancel_flag,
+                                       expected_duration=self.durations.get(self._urls[track_idx]))
+                if not track:
+                    if self.budget:
+                        self.budget.settle(track_idx)
+                    self._finish(TrackResult(track_idx, False, None, None, None, str(e)))
+                    return
+                if cache_key:
+                    # The file is analysed before encoding, so normalization is two-pass again
+                    cache_key = self.cache.make_key(source_key, self.high_quality, self.normalize_audio, self.mono_audio)
+        if not track.stream_url:
+            success, result = convert_track(track.filepath, track_idx, self.out_folder, self.high_quality, track.metadata(),
+                                            normalize_audio=self.normalize_audio, mono_audio=self.mono_audio,
+                                            source_key=source_key, on_progress=on_progress,
+                                            duration=track.duration, cancel_flag=self.cancel_flag,
+                                            audio_format=audio_format)
+        if self.budget:
+            self.budget.settle(track_idx, os.path.getsize(result) if success else None)
+        if success:
+            if cache_key:
+                self.cache.store(cache_key, result, track.title, track.thumbnail)
+            self._finish(TrackResult(track_idx, True, result, track.title, track.thumbnail, None))
         else:
-            logger.debug(f"Preserving original file: {format_file_size_with_extension(original_filepath)}")
-            
-        logger.info(f"Successfully converted track {idx}")
-        return True, out_path
+            self._finish(TrackResult(track_idx, False, None, track.title, track.thumbnail, result))
+
+    def _restore_cached(self, track_idx, cache_key):
+        entry = self.cache.lookup(cache_key)
+        if not entry:
+            return False
+        out_path = os.path.join(self.out_folder, f"track{track_idx}.ogg")
+        with trace_span('cache_restore') as span:
+            span['ok'] = restored = self.cache.restore(cache_key, out_path)
+        if not restored:
+            return False
+        title = entry.get('title') or "Unknown"
+        logger.info(f"Track {track_idx} restored from conversion cache: {title}")
+        if self.on_track_start:
+            self.on_track_start(track_idx, title)
+        if self.duplicates:
+            original_idx = self.duplicates.check(track_idx, out_path, cancel_flag=self.cancel_flag)
+            if original_idx is not None:
+                self._discard(out_path)
+                self._skip_duplicate(track_idx, original_idx, title, entry.get('thumbnail'))
+                return True
+        self._finish(TrackResult(track_idx, True, out_path, title, entry.get('thumbnail'), None))
+        return True
+
+    def _discard(self, filepath):
+        try:
+            if filepath and os.path.exists(filepath):
+                os.remove(filepath)
+        except Exception:
+            pass
+
+def clean_output_folder(folder):
+    """Delete every file in an output folder except songnames.xml."""
+    for f in os.listdir(folder):
+        if f == "songnames.xml":
+            continue
+        try:
+            fp = os.path.join(folder, f)
+            if os.path.isfile(fp):
+                os.remove(fp)
+        except Exception:
+            pass
+    get_slot_index(folder).invalidate()
+
+def find_audio_files(folder):
+    """List supported audio files under a folder, recursively and in a stable order."""
+    found = []
+    for root, dirs, names in os.walk(folder):
+        dirs.sort()
+        found.extend(os.path.join(root, name) for name in sorted(names)
+                     if name.lower().endswith(LOCAL_AUDIO_EXTS))
+    return found
+
+def fetch_thumbnail(url, idx):
+    """Download a track thumbnail into the app temp directory; returns its path or None."""
+    # Use cached app temp directory for thumbnail downloads
+    thumb_temp_dir = os.path.join(APP_TEMP_DIR, 'thumbnails')
+    os.makedirs(thumb_temp_dir, exist_ok=True)
+    thumb_path = os.path.join(thumb_temp_dir, f"coverart_{idx}.png")
+    try:
+        import urllib.request
+        with trace_span('thumbnail') as span:
+            urllib.request.urlretrieve(url, thumb_path)
+            span['bytes'] = os.path.getsize(thumb_path)
+        return thumb_path
     except Exception as e:
-        error_msg = f"Conversion error: {str(e)}"
-        logger.error(error_msg)
-        return False, error_msg
+        logger.warning(f"Thumbnail download failed: {e}")
+        return None
 
-def get_next_track_number(folder):
-    ext = ".ogg"
-    files = [f for f in os.listdir(folder) if re.match(r'track(\d+)' + re.escape(ext), f)]
-    numbers = [int(re.match(r'track(\d+)', f).group(1)) for f in files if re.match(r'track(\d+)', f)]
-    return max(numbers, default=0) + 1
+def save_cover_art(image_path, out_folder):
+    """Write the CD cover as a 512x512 coverart.png, letting FFmpeg decode whatever format the image is in."""
+    coverart_final = os.path.join(out_folder, "coverart.png")
+    cmd = [FFMPEG_PATH, '-y', '-i', image_path, '-vf', 'scale=512:512', '-frames:v', '1', coverart_final]
+    try:
+        with trace_span('cover_art') as span:
+            returncode, stderr = run_ffmpeg(cmd)
+            span['ok'] = returncode == 0
+    except OSError as e:
+        logger.warning(f"Cover art conversion failed: {e}")
+        return None
+    if returncode != 0:
+        logger.warning(f"Cover art conversion failed (return code {returncode}): {stderr.strip()[-300:]}")
+        return None
+    return coverart_final
 
 def confirm_and_clean_radio_folder(master, folder):
     existing_files = [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f)) and f != "songnames.xml"]
@@ -467,43 +2884,491 @@ def confirm_and_clean_radio_folder(master, folder):
         )
         if not proceed:
             return False
-    for f in os.listdir(folder):
-        if f == "songnames.xml":
-            continue
+    clean_output_folder(folder)
+    return True
+
+SyncPlan = namedtuple('SyncPlan', ['downloads', 'moves', 'removals', 'kept'])
+
+class FolderManifest:
+    """Record of which source ID lives in which trackN.ogg of an output folder.
+
+    Saved next to the tracks so a later run can sync the folder with a playlist
+    instead of wiping it and converting everything again.
+    """
+
+    def __init__(self, folder, data=None):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_FILENAME)
+        data = data or {}
+        self.encoding = data.get('encoding')
+        self.tracks = {int(k): v for k, v in data.get('tracks', {}).items()}
+        self.duplicates = data.get('duplicates', {})  # source ID -> source ID of the track it sounds like
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, folder):
+        return cls(folder, load_json_file(os.path.join(folder, MANIFEST_FILENAME), {}))
+
+    def can_sync(self, encoding):
+        """True when the folder holds tracks encoded with the given arguments."""
+        return bool(self.tracks) and self.encoding == list(encoding)
+
+    def reset(self, encoding):
+        with self._lock:
+            self.encoding = list(encoding)
+            self.tracks = {}
+            self.duplicates = {}
+
+    def record(self, idx, source_id, title=None):
+        with self._lock:
+            self.tracks[idx] = {'source_id': source_id, 'title': title}
+            self._save()
+
+    def record_duplicate(self, source_id, original_source_id):
+        """Remember a source that was left out as a reupload, so a sync doesn't download it again."""
+        with self._lock:
+            self.duplicates[source_id] = original_source_id
+            self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        data = {
+            'encoding': self.encoding,
+            'tracks': {str(k): v for k, v in sorted(self.tracks.items())},
+        }
+        if self.duplicates:
+            data['duplicates'] = self.duplicates
         try:
-            fp = os.path.join(folder, f)
-            if os.path.isfile(fp):
-                os.remove(fp)
-        except Exception:
+            write_json_atomic(self.path, data)
+        except OSError as e:
+            logger.warning(f"Could not save folder manifest: {e}")
+
+    def plan_sync(self, urls):
+        """Work out which playlist entries can keep an existing file and which need converting."""
+        existing = {}
+        for idx, entry in sorted(self.tracks.items()):
+            if os.path.isfile(os.path.join(self.folder, f"track{idx}.ogg")):
+                existing.setdefault(entry['source_id'], []).append(idx)
+
+        # Reuploads left out last time stay out while the track they duplicate is still in the playlist
+        playlist_ids = {get_source_id(url) for url in urls}
+        urls = [url for url in urls if self.duplicates.get(get_source_id(url)) not in playlist_ids]
+
+        downloads, moves = [], []
+        for new_idx, url in enumerate(urls, 1):
+            slots = existing.get(get_source_id(url))
+            if slots:
+                moves.append((slots.pop(0), new_idx))
+            else:
+                downloads.append((new_idx, url))
+        removals = sorted(idx for slots in existing.values() for idx in slots)
+        return SyncPlan(downloads, moves, removals, len(moves))
+
+    def apply_sync(self, plan):
+        """Delete dropped tracks and renumber kept ones without re-encoding them."""
+        def track_path(idx):
+            return os.path.join(self.folder, f"track{idx}.ogg")
+
+        with self._lock:
+            for idx in plan.removals:
+                try:
+                    os.remove(track_path(idx))
+                except OSError:
+                    pass
+            # Move kept tracks aside first so renumbering never overwrites another kept track
+            staged = []
+            for old_idx, new_idx in plan.moves:
+                temp_path = os.path.join(self.folder, f"sync_{new_idx}.tmp")
+                os.replace(track_path(old_idx), temp_path)
+                staged.append((temp_path, new_idx, self.tracks[old_idx]))
+            for f in os.listdir(self.folder):
+                if re.match(r'track\d+\.ogg$', f):
+                    os.remove(os.path.join(self.folder, f))
+            self.tracks = {}
+            for temp_path, new_idx, entry in staged:
+                os.replace(temp_path, track_path(new_idx))
+                self.tracks[new_idx] = entry
+            self._save()
+        get_slot_index(self.folder).invalidate()
+        logger.info(f"Synced folder: kept {plan.kept}, removed {len(plan.removals)}, {len(plan.downloads)} to convert")
+
+class JobJournal:
+    """Crash-safe record of a run's tracks, so an interrupted run can be resumed.
+
+    One journal per output folder is kept in JOURNAL_DIR. It holds the run's
+    settings and track list, and is rewritten atomically as each track
+    finishes, with that file's size, mtime and hash. It is deleted once every
+    track is done.
+    """
+
+    def __init__(self, folder, data=None):
+        self.folder = os.path.abspath(folder)
+        key = hashlib.sha1(os.path.normcase(self.folder).encode('utf-8')).hexdigest()
+        self.path = os.path.join(JOURNAL_DIR, f"{key}.json")
+        data = data or {}
+        self.settings = data.get('settings', {})
+        self.urls = [tuple(job) for job in data.get('urls', [])]  # [(idx, url), ...]
+        self.files = [tuple(job) for job in data.get('files', [])]  # [(idx, local file), ...]
+        self.completed = {int(k): v for k, v in data.get('completed', {}).items()}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, folder):
+        """Return the journal of an unfinished run into folder, or None."""
+        data = load_json_file(cls(folder).path)
+        return cls(folder, data) if data else None
+
+    @property
+    def total(self):
+        return len({idx for idx, _ in self.urls + self.files} | set(self.completed))
+
+    def start(self, settings, urls, files, completed=()):
+        """Begin journalling a new run; completed lists (idx, path) of tracks that are already in place."""
+        with self._lock:
+            self.settings = dict(settings)
+            self.urls = list(urls)
+            self.files = [(idx, os.path.abspath(path)) for idx, path in files]
+            self.completed = {idx: self._describe_output(path) for idx, path in completed}
+            self._save()
+
+    def complete(self, idx, path=None, duplicate_of=None):
+        """Record a finished track: its output file, or the track it was left out as a duplicate of."""
+        entry = self._describe_output(path) if path else {'duplicate_of': duplicate_of}
+        with self._lock:
+            self.completed[idx] = entry
+            self._save()
+
+    @staticmethod
+    def _describe_output(path):
+        st = os.stat(path)
+        return {'file': os.path.basename(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                'sha256': hash_file(path)}
+
+    def verify(self):
+        """Forget finished tracks whose file is gone or was changed; returns how many are left.
+
+        Files with their recorded size and mtime are trusted; only files whose
+        mtime moved are hashed again.
+        """
+        valid = {}
+        for idx, entry in self.completed.items():
+            if 'file' in entry:
+                path = os.path.join(self.folder, entry['file'])
+                try:
+                    st = os.stat(path)
+                    intact = st.st_size == entry['size'] and (
+                        st.st_mtime_ns == entry['mtime_ns'] or hash_file(path) == entry['sha256'])
+                except OSError:
+                    intact = False
+                if not intact:
+                    logger.info(f"Track {idx} of the unfinished run is missing or changed, it will be converted again")
+                    continue
+            valid[idx] = entry
+        with self._lock:
+            self.completed = valid
+            self._save()
+        return len(valid)
+
+    def pending_urls(self):
+        return [(idx, url) for idx, url in self.urls if idx not in self.completed]
+
+    def pending_files(self):
+        return [(idx, path) for idx, path in self.files if idx not in self.completed]
+
+    def describe(self):
+        return f"{len(self.completed)} of {self.total} tracks"
+
+    def finish(self):
+        """Delete the journal when nothing is left to do; failed tracks keep it for a later resume."""
+        if self.pending_urls() or self.pending_files():
+            logger.info(f"Run journal kept for resuming: {self.describe()} done")
+            return
+        self.discard()
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except OSError:
             pass
-    return True
+
+    def _save(self):
+        data = {
+            'folder': self.folder,
+            'settings': self.settings,
+            'urls': self.urls,
+            'files': self.files,
+            'completed': {str(k): v for k, v in sorted(self.completed.items())},
+            'updated_at': time.time(),
+        }
+        try:
+            write_json_atomic(self.path, data)
+        except OSError as e:
+            logger.warning(f"Could not save run journal: {e}")
 
 FFMPEG_PATH = resource_path(os.path.join('ffmpeg', 'bin', 'ffmpeg.exe')) \
     if sys.platform == "win32" else resource_path(os.path.join('ffmpeg', 'bin', 'ffmpeg'))
 
-# Debug logging for FFmpeg path resolution
-logger.info(f"FFmpeg path resolved to: {FFMPEG_PATH}")
-logger.info(f"FFmpeg executable exists: {os.path.exists(FFMPEG_PATH)}")
-if hasattr(sys, '_MEIPASS'):
+def probe_audio_stream(filepath):
+    """Read the first audio stream's codec, sample rate, channels and bitrate from FFmpeg's banner.
+
+    Returns a dict with those keys plus duration (None where FFmpeg doesn't
+    say), or None when FFmpeg finds no audio stream.
+    """
+    kwargs = {}
+    if sys.platform == "win32":
+        kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+    result = subprocess.run([FFMPEG_PATH, '-hide_banner', '-i', filepath], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, **kwargs)
+    text = result.stderr.decode('utf-8', errors='replace')
+    match = re.search(r'Stream #\d+:\d+.*?: Audio: (\w+)[^,\n]*, (\d+) Hz, ([^,\n]+)(.*)', text)
+    if not match:
+        return None
+    codec, rate, layout, rest = match.groups()
+    channels = {'mono': 1, 'stereo': 2}.get(layout.strip())
+    if channels is None:
+        count = re.match(r'(\d+)(?:\.(\d+))? ?(channels)?', layout.strip())
+        channels = int(count.group(1)) + int(count.group(2) or 0) if count else None
+    bitrate = re.search(r'(\d+) kb/s', rest) or re.search(r'bitrate: (\d+) kb/s', text)
+    return {'codec': codec, 'sample_rate': int(rate), 'channels': channels,
+            'bitrate': int(bitrate.group(1)) if bitrate else None, 'duration': parse_ffmpeg_duration(text)}
+
+def ogg_is_complete(filepath):
+    """Whether an Ogg file ends with a whole end-of-stream page, as files cut off mid-write don't.
+
+    An Ogg file's length is taken from its last page, so a truncated track
+    still looks like a valid, shorter one to FFmpeg.
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 65536))
+            tail = f.read()
+    except OSError:
+        return None
+    pos = tail.rfind(b'OggS')
+    if pos < 0 or len(tail) < pos + 27:
+        return False
+    segments = tail[pos + 26]
+    lacing = tail[pos + 27:pos + 27 + segments]
+    page_end = pos + 27 + segments + sum(lacing)
+    return bool(tail[pos + 5] & 0x04) and len(lacing) == segments and page_end == len(tail)
+
+def audit_track(filepath, cancel_flag=None):
+    """Probe one track and decode it completely, timing the decode as a measure of its load cost."""
+    entry = {'codec': None, 'sample_rate': None, 'channels': None, 'bitrate': None, 'duration': None,
+             'decoded_seconds': None, 'decode_seconds': None, 'complete': ogg_is_complete(filepath), 'errors': []}
+    try:
+        stream = probe_audio_stream(filepath)
+    except OSError as e:
+        entry['errors'] = [f"FFmpeg could not start: {e}"]
+        return entry
+    if stream is None:
+        entry['errors'] = ["No audio stream found"]
+        return entry
+    entry.update(stream)
+    decoded = {'fraction': 0.0}
+
+    def on_progress(fraction):
+        decoded['fraction'] = fraction
+
+    cmd = [FFMPEG_PATH, '-hide_banner', '-v', 'error', '-i', filepath, '-map', '0:a:0', '-f', 'null', '-']
+    started = time.perf_counter()
+    try:
+        returncode, stderr = run_ffmpeg(cmd, duration=entry['duration'], on_progress=on_progress,
+                                        cancel_flag=cancel_flag)
+    except OSError as e:
+        entry['errors'] = [f"FFmpeg could not start: {e}"]
+        return entry
+    entry['decode_seconds'] = round(time.perf_counter() - started, 3)
+    if entry['duration']:
+        entry['decoded_seconds'] = round(decoded['fraction'] * entry['duration'], 2)
+    entry['errors'] = stderr.strip().splitlines()[-5:]
+    if returncode != 0 and not entry['errors']:
+        entry['errors'] = [f"FFmpeg exited with code {returncode}"]
+    return entry
+
+def audit_problems(entry):
+    """Describe what is wrong with an audited track; an empty list when nothing is."""
+    problems = []
+    if entry['codec'] is None:
+        return ["unreadable"]
+    if entry['codec'] != 'vorbis':
+        problems.append(f"{entry['codec']} instead of Vorbis")
+    if entry['errors']:
+        problems.append("decode errors")
+    if (entry['duration'] and entry['decoded_seconds'] is not None
+            and entry['decoded_seconds'] < entry['duration'] - AUDIT_TRUNCATION_TOLERANCE):
+        problems.append(f"truncated ({entry['decoded_seconds']:.0f}s of {entry['duration']:.0f}s)")
+    elif entry.get('complete') is False:
+        problems.append("truncated")
+    if entry['sample_rate'] > AUDIT_MAX_SAMPLE_RATE:
+        problems.append(f"{entry['sample_rate'] / 1000:g}kHz")
+    if entry['bitrate'] and entry['bitrate'] > AUDIT_MAX_BITRATE:
+        problems.append(f"{entry['bitrate']}k")
+    if entry['bytes'] > AUDIT_MAX_TRACK_BYTES:
+        problems.append(f"{entry['bytes'] / (1024 * 1024):.1f}MB")
+    return problems
+
+def decoded_bytes(entry):
+    """Size of a track once decoded to 16-bit PCM, which is what loading it has to produce."""
+    if not (entry.get('duration') and entry.get('sample_rate') and entry.get('channels')):
+        return 0
+    return int(entry['duration'] * entry['sample_rate'] * entry['channels'] * 2)
+
+class AuditCache:
+    """Audit results per track file, reused while the file's size and mtime are unchanged."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'audit.json')
+        self._lock = threading.Lock()
+        self._data = load_json_file(self.path, {})
+
+    def get(self, filepath, st):
+        with self._lock:
+            cached = self._data.get(filepath)
+        if cached and cached['size'] == st.st_size and cached['mtime'] == st.st_mtime_ns:
+            return dict(cached['result'])
+        return None
+
+    def put(self, filepath, st, result):
+        with self._lock:
+            self._data[filepath] = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'result': result}
+
+    def save(self, keep):
+        """Write the cache, dropping files that are no longer in the audited folders."""
+        with self._lock:
+            self._data = {path: entry for path, entry in self._data.items() if path in keep}
+            try:
+                write_json_atomic(self.path, self._data)
+            except OSError as e:
+                logger.warning(f"Could not save audit cache: {e}")
+
+def audit_library(msc_path=None, workers=CONVERT_WORKERS, on_progress=None, cancel_flag=None):
+    """Audit every trackN.ogg in the game's Radio and CD folders, probing changed files in parallel.
+
+    Returns one entry per track, ordered by folder and track number, each
+    with its problems (see audit_problems) and decoded size. on_progress
+    receives (done, total) as files finish.
+    """
+    msc_path = msc_path or get_msc_path()
+    tracks = []
+    for folder in CD_SLOT_MAP.values():
+        try:
+            names = os.listdir(os.path.join(msc_path, folder))
+        except OSError:
+            continue
+        for name in names:
+            match = TRACK_FILE_RE.match(name)
+            if match:
+                tracks.append((folder, int(match.group(1)), os.path.join(msc_path, folder, name)))
+    tracks.sort()
+
+    cache = AuditCache()
+    entries, pending = {}, []
+    for folder, number, path in tracks:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        result = cache.get(path, st)
+        if result is None:
+            pending.append((folder, number, path, st))
+        else:
+            entries[path] = {**result, 'folder': folder, 'track': number, 'path': path, 'bytes': st.st_size, 'cached': True}
+    total = len(entries) + len(pending)
+    logger.info(f"Auditing {total} tracks in {msc_path} ({len(entries)} unchanged since the last audit)")
+    if on_progress:
+        on_progress(len(entries), total)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(audit_track, path, cancel_flag): (folder, number, path, st)
+                   for folder, number, path, st in pending}
+        for future in as_completed(futures):
+            folder, number, path, st = futures[future]
+            result = future.result()
+            if cancel_flag is not None and cancel_flag.is_set():
+                continue
+            cache.put(path, st, result)
+            entries[path] = {**result, 'folder': folder, 'track': number, 'path': path, 'bytes': st.st_size, 'cached': False}
+            if on_progress:
+                on_progress(len(entries), total)
+    cache.save(keep={path for _, _, path in tracks})
+
+    results = [entries[path] for _, _, path in tracks if path in entries]
+    for entry in results:
+        entry['problems'] = audit_problems(entry)
+        entry['decoded_bytes'] = decoded_bytes(entry)
+    return results
+
+def format_audit_report(entries):
+    """Plain-text summary of an audit with a table of problem tracks, heaviest to load first."""
+    def mb(size):
+        return f"{size / (1024 * 1024):.1f}MB"
+
+    folders = ', '.join(sorted({e['folder'] for e in entries}, key=list(CD_SLOT_MAP.values()).index)) or "no folders"
+    lines = [f"Audited {len(entries)} tracks in {folders}: {mb(sum(e['bytes'] for e in entries))} on disk, "
+             f"{mb(sum(e['decoded_bytes'] for e in entries))} decoded, "
+             f"{sum(e['decode_seconds'] or 0 for e in entries):.1f}s to decode"]
+    problems = sorted((e for e in entries if e['problems']), key=lambda e: e['decoded_bytes'], reverse=True)
+    if not problems:
+        lines.append("No problems found.")
+        return '\n'.join(lines)
+    lines.append(f"{len(problems)} tracks with problems:")
+    lines.append(f"{'Folder':<6} {'Track':<10} {'Size':>8} {'Rate':>6} {'Bitrate':>7} {'Length':>6} "
+                 f"{'Decoded':>9} {'Decode':>7}  Problems")
+    for e in problems:
+        length = f"{int(e['duration'] // 60)}:{int(e['duration'] % 60):02d}" if e['duration'] else "?"
+        rate = f"{e['sample_rate'] / 1000:g}k" if e['sample_rate'] else "?"
+        bitrate = f"{e['bitrate']}k" if e['bitrate'] else "?"
+        decode = f"{e['decode_seconds']:.2f}s" if e['decode_seconds'] is not None else "?"
+        lines.append(f"{e['folder']:<6} {'track' + str(e['track']):<10} {mb(e['bytes']):>8} {rate:>6} {bitrate:>7} "
+                     f"{length:>6} {mb(e['decoded_bytes']):>9} {decode:>7}  {', '.join(e['problems'])}")
+    return '\n'.join(lines)
+
+def log_runtime_environment():
+    """Log where FFmpeg was resolved and how the app is running."""
+    logger.info(f"FFmpeg path resolved to: {FFMPEG_PATH}")
+    logger.info(f"FFmpeg executable exists: {os.path.exists(FFMPEG_PATH)}")
+    if not hasattr(sys, '_MEIPASS'):
+        logger.info("Running from Python script (not bundled)")
+        return
     logger.info(f"Running from PyInstaller bundle: {sys._MEIPASS}")
+    ffmpeg_folder = os.path.join(sys._MEIPASS, 'ffmpeg')
+    if not os.path.exists(ffmpeg_folder):
+        logger.warning("FFmpeg folder not found in bundle")
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     # List contents of _MEIPASS to debug resource bundling
     try:
-        bundled_files = os.listdir(sys._MEIPASS)
-        logger.debug(f"Bundled files in _MEIPASS: {bundled_files}")
-        
-        # Check if ffmpeg folder exists
-        ffmpeg_folder = os.path.join(sys._MEIPASS, 'ffmpeg')
+        logger.debug(f"Bundled files in _MEIPASS: {os.listdir(sys._MEIPASS)}")
         if os.path.exists(ffmpeg_folder):
             logger.debug(f"FFmpeg folder found, contents: {os.listdir(ffmpeg_folder)}")
             ffmpeg_bin = os.path.join(ffmpeg_folder, 'bin')
             if os.path.exists(ffmpeg_bin):
                 logger.debug(f"FFmpeg bin folder found, contents: {os.listdir(ffmpeg_bin)}")
-        else:
-            logger.warning("FFmpeg folder not found in bundle")
     except Exception as e:
         logger.warning(f"Could not list bundle contents: {e}")
-else:
-    logger.info("Running from Python script (not bundled)")
+
+def finish_startup():
+    """Startup work the window doesn't need to appear; runs in the background once the GUI is up."""
+    log_runtime_environment()
+    try:
+        create_msc_folders()
+    except OSError as e:
+        logger.warning(f"Could not create MSC output directories: {e}")
+    # Import yt-dlp now so the first Start click doesn't pay for it
+    load_yt_dlp()
+    sweep_temp_storage()
+
+def load_gui_modules():
+    """Import Tk on demand; the command line never needs it."""
+    global tk, ttk, messagebox, filedialog, ScrolledText
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog
+    from tkinter.scrolledtext import ScrolledText
 
 class MSCPlaylistGUI:
     """Main GUI application for downloading and converting audio for My Summer Car."""
@@ -671,8 +3536,15 @@ class MSCPlaylistGUI:
 
         self.open_output_btn = tk.Button(self.button_frame, text="Output Folder", command=self.open_output_folder)
         self.open_output_btn.pack(side="right", padx=(8, 0))
+        self.budget_bytes = None
+        self.budget_per_track = False
+        self.budget_button = tk.Button(self.button_frame, text="Size Limit", command=self.edit_size_budget)
+        self.budget_button.pack(side="right", padx=(8, 0))
+        self.audit_button = tk.Button(self.button_frame, text="Audit", command=self.open_audit_window)
+        self.audit_button.pack(side="right", padx=(8, 0))
 
         self.playlist = []
+        self.progress_model = None
         self.thumbnail_path = None
         self.local_files = []  # Store selected local files
         self.update_cd_controls()
@@ -724,14 +3596,128 @@ class MSCPlaylistGUI:
             return
         self.cover_path_var.set(path)
 
+    def edit_size_budget(self):
+        """Ask for a size limit; while one is set, bitrates are chosen to fit it instead of High Quality."""
+        dialog = tk.Toplevel(self.master)
+        dialog.title("Size Limit")
+        dialog.resizable(False, False)
+        dialog.transient(self.master)
+        dialog.grab_set()
+
+        row = tk.Frame(dialog)
+        row.pack(padx=10, pady=(10, 4))
+        tk.Label(row, text="Limit (MB, 0 = off):").pack(side="left")
+        size_var = tk.StringVar(value=f"{self.budget_bytes / (1024 * 1024):g}" if self.budget_bytes else "0")
+        size_entry = tk.Entry(row, width=8, textvariable=size_var, justify="center")
+        size_entry.pack(side="left", padx=(4, 0))
+        per_track_var = tk.BooleanVar(value=self.budget_per_track)
+        tk.Radiobutton(dialog, text="For the whole folder", variable=per_track_var, value=False).pack(anchor="w", padx=10)
+        tk.Radiobutton(dialog, text="For each track", variable=per_track_var, value=True).pack(anchor="w", padx=10)
+
+        def apply():
+            try:
+                size = parse_size(size_var.get() or "0")
+            except ValueError:
+                messagebox.showerror("Size Limit", "Enter a size in MB, for example 200.", parent=dialog)
+                return
+            self.set_size_budget(size or None, per_track_var.get())
+            logger.info(f"Size limit: {self.size_budget_label() or 'off'}")
+            dialog.destroy()
+
+        buttons = tk.Frame(dialog)
+        buttons.pack(pady=(6, 10))
+        tk.Button(buttons, text="OK", width=8, command=apply).pack(side="left", padx=4)
+        tk.Button(buttons, text="Cancel", width=8, command=dialog.destroy).pack(side="left", padx=4)
+        dialog.bind('<Return>', lambda event: apply())
+        size_entry.focus_set()
+
+    def open_audit_window(self):
+        """Audit the game's Radio and CD folders in the background and show the report."""
+        window = tk.Toplevel(self.master)
+        window.title("Library Audit")
+        text = ScrolledText(window, width=110, height=24, font=("Courier", 9), wrap="none")
+        text.pack(fill="both", expand=True, padx=6, pady=6)
+        text.insert(tk.END, "Auditing tracks ...")
+        text.config(state="disabled")
+        cancel_flag = threading.Event()
+        self.audit_button.config(state="disabled")
+
+        def show(message):
+            if not window.winfo_exists():
+                return
+            text.config(state="normal")
+            text.delete("1.0", tk.END)
+            text.insert(tk.END, message)
+            text.config(state="disabled")
+
+        def close():
+            cancel_flag.set()
+            self.audit_button.config(state="normal")
+            window.destroy()
+
+        def task():
+            try:
+                entries = audit_library(on_progress=lambda done, total: self.master.after(
+                    0, show, f"Auditing tracks ... {done}/{total}"), cancel_flag=cancel_flag)
+                report = format_audit_report(entries)
+                logger.info(report)
+            except Exception as e:
+                logger.error(f"Audit failed: {e}")
+                report = f"Audit failed: {e}"
+            if not cancel_flag.is_set():
+                self.master.after(0, show, report)
+                self.master.after(0, self.audit_button.config, {'state': "normal"})
+
+        window.protocol("WM_DELETE_WINDOW", close)
+        threading.Thread(target=task, daemon=True).start()
+
+    def set_size_budget(self, size, per_track):
+        self.budget_bytes = size
+        self.budget_per_track = per_track
+        self.budget_button.config(text="Size Limit*" if size else "Size Limit")
+        self.high_quality_checkbox.config(state="disabled" if size else "normal")
+
+    def run_settings(self, inputs):
+        """The settings a run is journalled with, in the same form the command line uses."""
+        return {
+            'inputs': inputs,
+            'high_quality': self.high_quality_var.get(),
+            'normalize_audio': self.normalize_audio_var.get(),
+            'mono_audio': self.mono_audio_var.get(),
+            'budget': None if self.budget_per_track else self.budget_bytes,
+            'track_budget': self.budget_bytes if self.budget_per_track else None,
+            'cover': self.cover_path_var.get() or None,
+        }
+
+    def apply_run_settings(self, settings):
+        """Restore the options of a journalled run before resuming it."""
+        self.high_quality_var.set(settings.get('high_quality', False))
+        self.normalize_audio_var.set(settings.get('normalize_audio', True))
+        self.mono_audio_var.set(settings.get('mono_audio', False))
+        self.set_size_budget(settings.get('budget') or settings.get('track_budget'), bool(settings.get('track_budget')))
+        self.cover_path_var.set(settings.get('cover') or "")
+
+    def size_budget_label(self):
+        if not self.budget_bytes:
+            return None
+        return f"{self.budget_bytes / (1024 * 1024):g}MB {'per track' if self.budget_per_track else 'per folder'}"
+
     def safe_after(self, func, *args, **kwargs):
         if self.cancel_flag.is_set():
             return
         self.master.after(0, lambda: func(*args, **kwargs))
 
-    def set_progress(self, current, total):
-        percent = int(current / total * 100)
-        self.progress['value'] = percent
+    def poll_progress(self):
+        """Refresh the progress bar and ETA from the running batch's progress model."""
+        model = self.progress_model
+        if model is None or self.cancel_flag.is_set():
+            return
+        if self.current_thread is None or not self.current_thread.is_alive():
+            self.update_eta(None)
+            return
+        self.progress['value'] = int(model.fraction() * 100)
+        self.update_eta(model.eta())
+        self.master.after(PROGRESS_POLL_MS, self.poll_progress)
 
     def set_status(self, status):
         self.status_var.set(status)
@@ -786,7 +3772,7 @@ class MSCPlaylistGUI:
 
     def get_output_folder(self):
         val = self.output_mode_var.get()
-        return os.path.join(DEFAULT_MSC_PATH, CD_SLOT_MAP[val])
+        return os.path.join(get_msc_path(), CD_SLOT_MAP[val])
 
     def open_output_folder(self):
         path = self.get_output_folder()
@@ -830,37 +3816,55 @@ class MSCPlaylistGUI:
         url = self.entry.get().strip()
         out_folder = self.get_output_folder()
         is_cd = self.output_mode_var.get().startswith("CD")
+
+        # An interrupted run into this folder can be picked up where it stopped
+        journal = JobJournal.load(out_folder)
+        resume = False
+        if journal and journal.verify() < journal.total:
+            choice = messagebox.askyesnocancel(
+                "Resume Unfinished Run",
+                f"The last run into this folder stopped after {journal.describe()}.\n\n"
+                "Yes: resume it with the same settings\n"
+                "No: forget it and start this run instead"
+            )
+            if choice is None:
+                self.show_error("Aborted by user.")
+                return
+            resume = choice
+        if resume:
+            self.apply_run_settings(journal.settings)
+        else:
+            if journal:
+                journal.discard()
+            journal = JobJournal(out_folder)
         
         logger.info(f"Starting download process. URL: {url}, Output: {out_folder}")
         logger.info(f"High Quality Audio: {'ENABLED' if self.high_quality_var.get() else 'DISABLED (96k, 22kHz)'}")
         logger.info(f"Audio Normalization: {'ENABLED' if self.normalize_audio_var.get() else 'DISABLED'}")
         logger.info(f"Mono Audio: {'ENABLED' if self.mono_audio_var.get() else 'DISABLED'}")
+        logger.info(f"Size Limit: {self.size_budget_label() or 'DISABLED'}")
+        start_run_trace(f"gui {self.output_mode_var.get()}")
 
         urls_to_dl = []
         local_files_to_convert = []
         single_track = False
         
+        if resume:
+            urls_to_dl = [track_url for _, track_url in journal.urls]
+            local_files_to_convert = [path for _, path in journal.files]
         # Check if we have local files selected
-        if hasattr(self, 'local_files') and self.local_files and "[" in url and "local files selected]" in url:
+        elif hasattr(self, 'local_files') and self.local_files and "[" in url and "local files selected]" in url:
             local_files_to_convert = self.local_files
             logger.info(f"Processing {len(local_files_to_convert)} selected local files")
         elif url:
-            if is_youtube_track(url) or is_soundcloud_track(url):
-                urls_to_dl = get_single_track_info(url)
-                single_track = True
-                logger.info("Detected single track")
-            elif is_soundcloud_playlist(url):
-                urls_to_dl = get_soundcloud_playlist_tracks(url)
-                logger.info(f"Detected SoundCloud playlist with {len(urls_to_dl)} tracks")
-            elif is_youtube_playlist(url):
-                urls_to_dl = get_youtube_playlist_videos(url)
-                logger.info(f"Detected YouTube playlist with {len(urls_to_dl)} tracks")
-            else:
+            resolved = resolve_url(url)
+            if resolved is None:
                 logger.error(f"Invalid URL format: {url}")
                 self.show_error("Invalid link. Please enter a SoundCloud/YouTube link.")
                 return
+            urls_to_dl, single_track = resolved
 
-        total = len(urls_to_dl) + len(local_files_to_convert)
+        total = journal.total if resume else len(urls_to_dl) + len(local_files_to_convert)
         if total == 0:
             self.show_error("No songs to process. Please enter a link or use the Local Audio button.")
             return
@@ -872,10 +3876,36 @@ class MSCPlaylistGUI:
                 self.show_error(f"Output folder not found and could not be created:\n{out_folder}")
                 return
 
-        if not single_track:
-            if not confirm_and_clean_radio_folder(self.master, out_folder):
+        budget_bytes, budget_per_track = self.budget_bytes, self.budget_per_track
+        encoding = encoding_key(self.high_quality_var.get(), self.normalize_audio_var.get(), self.mono_audio_var.get(),
+                                size_budget=bool(budget_bytes))
+        manifest = FolderManifest.load(out_folder)
+        sync_plan = None
+        if resume:
+            logger.info(f"Resuming unfinished run: {journal.describe()} already done")
+        elif not single_track:
+            if urls_to_dl and manifest.can_sync(encoding):
+                choice = messagebox.askyesnocancel(
+                    "Sync Existing Tracks",
+                    f"This folder already has {len(manifest.tracks)} converted tracks.\n\n"
+                    "Yes: keep tracks that are still in the playlist and only download new ones\n"
+                    "No: DELETE ALL FILES in this folder and convert everything again"
+                )
+                if choice is None:
+                    self.show_error("Aborted by user (output folder not cleaned).")
+                    return
+                if choice:
+                    sync_plan = manifest.plan_sync(urls_to_dl)
+                else:
+                    clean_output_folder(out_folder)
+            elif not confirm_and_clean_radio_folder(self.master, out_folder):
                 self.show_error("Aborted by user (output folder not cleaned).")
                 return
+            if sync_plan is None:
+                manifest.reset(encoding)
+        elif not manifest.can_sync(encoding):
+            # Tracks from other settings can't be reused by a later sync, so start a fresh record
+            manifest.reset(encoding)
 
         self.progress['value'] = 0
         self.set_status("Processing ...")
@@ -886,135 +3916,114 @@ class MSCPlaylistGUI:
 
         def task():
             files = []
-            coverart_done = False
+            reserved = []
             coverart_path = self.cover_path_var.get()
-            elapsed_times = []
-            download_times = []
-            convert_times = []
-            eta_seconds = None
-            stop_eta = threading.Event()
-            ROLLING_WINDOW = 8
-
-            def eta_countdown():
-                nonlocal eta_seconds
-                while not stop_eta.is_set() and eta_seconds is not None and eta_seconds > 0:
-                    self.safe_after(self.update_eta, eta_seconds)
-                    time.sleep(1)
-                    eta_seconds -= 1
-                self.safe_after(self.update_eta, eta_seconds)
-
-            eta_thread = None
+
+            def on_track_start(track_idx, title):
+                self.safe_after(self.set_current_song, title, track_idx, total)
+
+            def on_track_done(result, completed):
+                if result.success:
+                    journal.complete(result.idx, result.path)
+                elif result.duplicate_of is not None and not result.error:
+                    journal.complete(result.idx, duplicate_of=result.duplicate_of)
+                elif result.error:
+                    self.safe_after(self.show_error, result.error)
+
             try:
+                if resume:
+                    jobs, file_jobs = journal.pending_urls(), journal.pending_files()
+                    for idx, entry in journal.completed.items():
+                        progress.complete(idx)
+                        if 'file' in entry:
+                            files.append(os.path.join(out_folder, entry['file']))
+                else:
+                    moved = []
+                    if single_track:
+                        reserved = get_slot_index(out_folder).reserve(fill_gaps=FILL_TRACK_GAPS)
+                        jobs = [(reserved[0], urls_to_dl[0])]
+                    elif sync_plan:
+                        manifest.apply_sync(sync_plan)
+                        jobs = sync_plan.downloads
+                        moved = [(new_idx, os.path.join(out_folder, f"track{new_idx}.ogg")) for _, new_idx in sync_plan.moves]
+                        for new_idx, path in moved:
+                            progress.complete(new_idx)
+                            files.append(path)
+                    else:
+                        jobs = list(enumerate(urls_to_dl, 1))
+                    file_jobs = list(enumerate(local_files_to_convert, len(urls_to_dl) + 1))
+                    journal.start(self.run_settings([url] if urls_to_dl else local_files_to_convert),
+                                  jobs, file_jobs, completed=moved)
+                budget = self.make_size_budget(budget_bytes, budget_per_track, out_folder, jobs, file_jobs,
+                                               journal.settings.get('inputs', []))
+
                 # Process URLs first (if any)
-                for idx, media_url in enumerate(urls_to_dl, 1):
-                    start_download = time.time()
+                if jobs:
+                    pipeline = TrackPipeline(
+                        jobs, out_folder,
+                        high_quality=self.high_quality_var.get(),
+                        normalize_audio=self.normalize_audio_var.get(),
+                        mono_audio=self.mono_audio_var.get(),
+                        cancel_flag=self.cancel_flag,
+                        on_track_start=on_track_start,
+                        on_track_done=on_track_done,
+                        cache=get_conversion_cache(),
+                        manifest=manifest,
+                        progress=progress,
+                        budget=budget,
+                        duplicates=DuplicateDetector() if ACOUSTIC_DEDUPE else None,
+                        durations=input_durations(journal.settings.get('inputs', [])),
+                    )
+                    results = pipeline.run()
                     if self.cancel_flag.is_set():
                         self.safe_after(self.set_status, "Cancelled")
                         self.safe_after(self.download_button.config, state='normal')
                         self.safe_after(self.cancel_button.config, state='disabled')
                         return
-                    if single_track:
-                        track_idx = get_next_track_number(out_folder)
-                        filepath, title, thumbnail = download_track(media_url, os.path.join(out_folder, f"track{track_idx}"))
-                        info = None
-                        try:
-                            with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                                info = ydl.extract_info(media_url, download=False)
-                        except Exception:
-                            pass
-                        metadata = {}
-                        if info:
-                            metadata['title'] = info.get('title')
-                            metadata['artist'] = info.get('artist') or info.get('uploader')
-                            metadata['genre'] = info.get('genre')
-                            duration = info.get('duration')
-                            if duration:
-                                minutes = int(duration // 60)
-                                seconds = int(duration % 60)
-                                metadata['comment'] = f"Length: {minutes}:{seconds:02d}"
-                        else:
-                            metadata['title'] = title
-                        success, result = convert_track(filepath, track_idx, out_folder, self.high_quality_var.get(), metadata, normalize_audio=self.normalize_audio_var.get(), mono_audio=self.mono_audio_var.get())
-                    else:
-                        track_idx = idx
-                        filepath, title, thumbnail = download_track(media_url, os.path.join(out_folder, f"track{track_idx}"))
-                        metadata = {'title': title}
-                        success, result = convert_track(filepath, track_idx, out_folder, self.high_quality_var.get(), metadata, normalize_audio=self.normalize_audio_var.get(), mono_audio=self.mono_audio_var.get())
-                    end_download = time.time()
-                    download_time = end_download - start_download
-                    if not filepath:
-                        continue
-                    self.safe_after(self.set_current_song, title or "Unknown", track_idx, total)
-                    if not success:
-                        self.safe_after(self.show_error, result)
-                        continue
-                    start_convert = time.time()
-                    files.append(result)
-                    end_convert = time.time()
-                    convert_time = end_convert - start_convert
-                    download_times.append(download_time)
-                    convert_times.append(convert_time)
-                    if len(download_times) > ROLLING_WINDOW:
-                        download_times.pop(0)
-                    if len(convert_times) > ROLLING_WINDOW:
-                        convert_times.pop(0)
-                    def filter_outliers(times):
-                        if not times:
-                            return times
-                        median = sorted(times)[len(times)//2]
-                        return [t for t in times if t < 2*median]
-                    filtered_download = filter_outliers(download_times)
-                    filtered_convert = filter_outliers(convert_times)
-                    avg_download = sum(filtered_download) / len(filtered_download) if filtered_download else 0
-                    avg_convert = sum(filtered_convert) / len(filtered_convert) if filtered_convert else 0
-                    avg_time = avg_download + avg_convert
-                    remaining = total - idx
-                    eta_seconds = int(avg_time * remaining)
-                    if eta_thread is None or not eta_thread.is_alive():
-                        eta_thread = threading.Thread(target=eta_countdown, daemon=True)
-                        eta_thread.start()
-                    if is_cd and not coverart_done and not coverart_path and thumbnail:
-                        # Use cached app temp directory for thumbnail downloads
-                        thumb_temp_dir = os.path.join(APP_TEMP_DIR, 'thumbnails')
-                        os.makedirs(thumb_temp_dir, exist_ok=True)
-                        thumb_path = os.path.join(thumb_temp_dir, f"coverart_{idx}.png")
-                        try:
-                            import urllib.request
-                            urllib.request.urlretrieve(thumbnail, thumb_path)
-                            coverart_path = thumb_path
-                            coverart_done = True
-                        except Exception:
-                            pass
-                    self.safe_after(self.set_progress, idx, total)
+                    files.extend(r.path for r in results if r.success)
+                    # Use the thumbnail of the earliest track so the cover art is deterministic
+                    thumb_source = next((r for r in results if r.success and r.thumbnail), None)
+                    keep_cover = (sync_plan or resume) and os.path.exists(os.path.join(out_folder, "coverart.png"))
+                    if is_cd and not coverart_path and thumb_source and not keep_cover:
+                        coverart_path = fetch_thumbnail(thumb_source.thumbnail, thumb_source.idx)
 
                 # Process local files (if any)
-                start_idx = len(urls_to_dl)
-                for file_idx, localfile in enumerate(local_files_to_convert, 1):
-                    idx = start_idx + file_idx
+                if file_jobs:
+                    cache = get_conversion_cache()
+                    names = {}
+                    scheduler = ConversionScheduler(
+                        cancel_flag=self.cancel_flag,
+                        on_job_start=lambda job_idx: self.safe_after(self.set_current_song, names[job_idx], job_idx, total),
+                    )
+                    for idx, localfile in file_jobs:
+                        names[idx] = os.path.basename(localfile)
+                        scheduler.submit(idx, convert_local_file, localfile, idx, out_folder, self.high_quality_var.get(),
+                                         normalize_audio=self.normalize_audio_var.get(),
+                                         mono_audio=self.mono_audio_var.get(), cache=cache,
+                                         on_progress=functools.partial(progress.update, idx, 'encode'),
+                                         cancel_flag=self.cancel_flag, budget=budget)
+                    try:
+                        for idx, success, result in scheduler.results():
+                            progress.complete(idx)
+                            if not success:
+                                if not self.cancel_flag.is_set():
+                                    self.safe_after(self.show_error, result)
+                                continue
+                            journal.complete(idx, result)
+                            files.append(result)
+                    finally:
+                        scheduler.shutdown()
+                        cache.log_stats()
+                        temp_copy_stats.log_and_reset()
                     if self.cancel_flag.is_set():
                         self.safe_after(self.set_status, "Cancelled")
                         self.safe_after(self.download_button.config, state='normal')
                         self.safe_after(self.cancel_button.config, state='disabled')
                         return
-                    fname = os.path.basename(localfile)
-                    self.safe_after(self.set_current_song, fname, idx, total)
-                    success, result = convert_track(localfile, idx, out_folder, self.high_quality_var.get(), None, delete_original=False, normalize_audio=self.normalize_audio_var.get(), mono_audio=self.mono_audio_var.get())
-                    if not success:
-                        self.safe_after(self.show_error, result)
-                        continue
-                    files.append(result)
-                    self.safe_after(self.set_progress, idx, total)
+                journal.finish()
 
-                stop_eta.set()
-                self.safe_after(self.eta_var.set, "ETA: --:--")
                 if is_cd and coverart_path:
-                    coverart_final = os.path.join(out_folder, "coverart.png")
-                    try:
-                        img = Image.open(coverart_path)
-                        img = img.resize((512,512))
-                        img.save(coverart_final)
-                    except Exception:
-                        pass
+                    save_cover_art(coverart_path, out_folder)
 
                 self.safe_after(self.clear_current_song)
                 # Clear local files selection after processing
@@ -1031,22 +4040,40 @@ class MSCPlaylistGUI:
                     self.safe_after(self.show_error, "No songs processed.")
                 self.safe_after(self.cancel_button.config, state='disabled')
             except Exception as e:
-                stop_eta.set()
                 self.safe_after(self.show_error, str(e))
                 self.safe_after(self.set_status, "Waiting")
                 self.safe_after(self.cancel_button.config, state='disabled')
             finally:
-                stop_eta.set()
+                get_slot_index(out_folder).settle(reserved)
+                finish_run_trace()
                 self.safe_after(self.download_button.config, state='normal')
+                sweep_temp_storage()
 
+        progress = ProgressModel(total, stages=('encode',) if local_files_to_convert else ('download', 'encode'))
+        self.progress_model = progress
         self.current_thread = threading.Thread(target=task, daemon=True)
         self.current_thread.start()
+        self.master.after(PROGRESS_POLL_MS, self.poll_progress)
+
+    def make_size_budget(self, budget_bytes, per_track, out_folder, jobs, file_jobs, inputs):
+        """Build the SizeBudget for a run, or None when no size limit is set."""
+        if not budget_bytes:
+            return None
+        url_durations = input_durations(inputs)
+        durations = {idx: url_durations.get(track_url) for idx, track_url in jobs}
+        durations.update((idx, probe_duration(f)) for idx, f in file_jobs)
+        budget = SizeBudget(total_bytes=None if per_track else budget_bytes,
+                            per_track_bytes=budget_bytes if per_track else None,
+                            mono_audio=self.mono_audio_var.get(), track_count=len(jobs) + len(file_jobs),
+                            used_bytes=folder_track_bytes(out_folder), durations=durations)
+        logger.info(f"Size budget: {budget.describe()}, {budget.used_bytes / (1024 * 1024):.1f}MB already used")
+        return budget
 
     def convert_local_files(self):
         files = filedialog.askopenfilenames(
             title="Select audio files to convert",
             filetypes=[
-                ("Audio files", "*.mp3 *.wav *.ogg *.flac *.aac *.m4a"),
+                ("Audio files", " ".join("*" + ext for ext in LOCAL_AUDIO_EXTS)),
                 ("MP3 files", "*.mp3"),
                 ("WAV files", "*.wav"),
                 ("OGG files", "*.ogg"),
@@ -1079,18 +4106,355 @@ class MSCPlaylistGUI:
         self.status_song_var.set("Cancelled")
         self.eta_var.set("ETA: --:--")
         self.cancel_button.config(state='disabled')
-        self.download_button.config(state='normal')
+        # Workers stop their child processes on their own; wait for them without blocking the UI
+        self.wait_for_cancel(time.monotonic())
+
+    def wait_for_cancel(self, started):
         if self.current_thread and self.current_thread.is_alive():
-            self.current_thread.join(timeout=1.0)
+            self.download_button.config(state='disabled')
+            self.master.after(100, self.wait_for_cancel, started)
+            return
+        logger.info(f"Cancel completed in {time.monotonic() - started:.2f}s")
         self.current_thread = None
+        self.download_button.config(state='normal')
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="MSCPlaylistConverter",
+        description="Convert YouTube/SoundCloud links and local audio into My Summer Car tracks without the GUI. "
+                    "Progress and results are written to stdout as JSON lines; logs go to stderr.",
+    )
+    parser.add_argument("inputs", nargs="*", metavar="INPUT",
+                        help="track or playlist link, audio file, or folder of audio files")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the unfinished run into the output folder with its original inputs and settings")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--slot", choices=list(CD_SLOT_MAP), default="Radio",
+                        help="My Summer Car folder to fill (default: Radio)")
+    target.add_argument("--output-dir", help="write tracks to this folder instead of a game folder")
+    parser.add_argument("--msc-path", help="My Summer Car install folder (default: found through Steam)")
+    parser.add_argument("--ffmpeg", help="FFmpeg executable to use instead of the bundled one")
+    parser.add_argument("--mode", choices=["append", "replace", "sync"], default="append",
+                        help="append after existing tracks, replace the folder contents, "
+                             "or sync it with the playlist (default: append)")
+    parser.add_argument("--high-quality", action="store_true", help="320k/48kHz instead of 96k/22kHz")
+    parser.add_argument("--normalize", action="store_true", help="normalize loudness")
+    parser.add_argument("--mono", action="store_true", help="downmix to mono")
+    parser.add_argument("--stream", action="store_true", default=STREAMING_MODE,
+                        help="pipe downloads straight into FFmpeg when the format allows it")
+    parser.add_argument("--jobs", type=int, default=CONVERT_WORKERS, help="parallel FFmpeg conversions")
+    parser.add_argument("--cover", help="cover image for a CD folder (default: first track's thumbnail)")
+    budget = parser.add_mutually_exclusive_group()
+    budget.add_argument("--budget", type=parse_size, metavar="SIZE",
+                        help="pick bitrate, sample rate and channels per track so the whole folder stays under "
+                             "SIZE, e.g. 700M or 1.5G (plain numbers are MB); overrides --high-quality")
+    budget.add_argument("--track-budget", type=parse_size, metavar="SIZE",
+                        help="like --budget, but a size limit for each track")
+    parser.add_argument("--dedupe-audio", action="store_true", default=ACOUSTIC_DEDUPE,
+                        help="compare downloaded audio to catch reuploads of the same song")
+    parser.add_argument("--duplicates", choices=["skip", "link"], default=DUPLICATE_POLICY,
+                        help="leave reuploads out, or hard-link them to the kept track (default: %(default)s)")
+    parser.add_argument("--fill-gaps", action="store_true", default=FILL_TRACK_GAPS,
+                        help="in append mode, reuse track numbers left free by deleted tracks")
+    parser.add_argument("--audit", action="store_true",
+                        help="check every track in the game's Radio and CD folders for corrupt, truncated or "
+                             "oversized files and exit")
+    parser.add_argument("--temp-usage", action="store_true",
+                        help="clean up the app's temp folder, print what it holds and exit")
+    return parser
+
+def run_audit_cli(workers):
+    """Audit the game folders, printing problem tracks and a summary as JSON lines."""
+    entries = audit_library(workers=workers)
+    for entry in entries:
+        if entry['problems']:
+            sys.stdout.write(json.dumps({'event': 'audit_track', **entry}) + "\n")
+    sys.stdout.write(json.dumps({
+        'event': 'audit_summary',
+        'tracks': len(entries),
+        'problems': sum(1 for e in entries if e['problems']),
+        'bytes': sum(e['bytes'] for e in entries),
+        'decoded_bytes': sum(e['decoded_bytes'] for e in entries),
+        'decode_seconds': round(sum(e['decode_seconds'] or 0 for e in entries), 3),
+        'cached': sum(1 for e in entries if e['cached']),
+    }) + "\n")
+    logger.info(format_audit_report(entries))
+    return EXIT_OK
+
+def run_cli(argv=None):
+    """Run a conversion from the command line and return the process exit code."""
+    global _msc_path, FFMPEG_PATH
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.temp_usage:
+        storage = get_temp_storage()
+        storage.sweep()
+        sys.stdout.write(json.dumps({'event': 'temp_usage', **storage.usage()}) + "\n")
+        return EXIT_OK
+    if not args.inputs and not args.resume and not args.audit:
+        parser.error("give at least one INPUT, or --resume")
+    if args.msc_path:
+        _msc_path = args.msc_path
+    if args.ffmpeg:
+        FFMPEG_PATH = args.ffmpeg
+    elif not os.path.exists(FFMPEG_PATH) and shutil.which("ffmpeg"):
+        FFMPEG_PATH = shutil.which("ffmpeg")
+        logger.info(f"Bundled FFmpeg not found, using {FFMPEG_PATH}")
+    if args.audit:
+        return run_audit_cli(args.jobs)
+
+    trace = start_run_trace(f"cli {args.mode}")
+    try:
+        return _run_cli_traced(parser, args, trace)
+    finally:
+        # Early exits (bad inputs, parser errors) still close the trace with its summary line
+        if trace is _run_trace:
+            finish_run_trace()
+
+def _run_cli_traced(parser, args, trace):
+    """The conversion part of run_cli, with the run trace already started."""
+    output_lock = threading.Lock()
+
+    def emit(event, **fields):
+        with output_lock:
+            sys.stdout.write(json.dumps({'event': event, **fields}) + "\n")
+            sys.stdout.flush()
+
+    urls, local_files = [], []
+    url_durations = {}
+    for item in [] if args.resume else args.inputs:
+        if re.match(r'https?://', item):
+            try:
+                resolved = resolve_url(item)
+            except Exception as e:
+                emit('error', input=item, error=str(e))
+                return EXIT_FAILED
+            if resolved is None:
+                parser.error(f"not a SoundCloud/YouTube track or playlist link: {item}")
+            urls.extend(resolved[0])
+            if not resolved[1]:
+                url_durations.update(get_playlist_durations(item))
+        elif os.path.isdir(item):
+            local_files.extend(find_audio_files(item))
+        elif os.path.isfile(item):
+            local_files.append(item)
+        else:
+            parser.error(f"no such file, folder or link: {item}")
+    # Merged playlists often share tracks
+    urls = dedupe_urls(urls)
+    total = len(urls) + len(local_files)
+    if total == 0 and not args.resume:
+        emit('error', error="No songs to process")
+        return EXIT_FAILED
+
+    log_runtime_environment()
+    # Leftovers of crashed runs are cleared while this one gets going
+    sweeper = threading.Thread(target=sweep_temp_storage, daemon=True)
+    sweeper.start()
+    out_folder = args.output_dir or os.path.join(get_msc_path(), CD_SLOT_MAP[args.slot])
+    is_cd = not args.output_dir and args.slot.startswith("CD")
+    try:
+        os.makedirs(out_folder, exist_ok=True)
+    except OSError as e:
+        emit('error', error=f"Output folder could not be created: {e}")
+        return EXIT_FAILED
+
+    journal = JobJournal(out_folder)
+    if args.resume:
+        journal = JobJournal.load(out_folder)
+        if journal is None:
+            emit('error', error=f"No unfinished run to resume in {out_folder}")
+            return EXIT_FAILED
+        journal.verify()
+        settings = journal.settings
+        args.high_quality = settings.get('high_quality', False)
+        args.normalize = settings.get('normalize_audio', False)
+        args.mono = settings.get('mono_audio', False)
+        args.budget = settings.get('budget')
+        args.track_budget = settings.get('track_budget')
+        args.cover = args.cover or settings.get('cover')
+        url_durations = input_durations(settings.get('inputs', []))
+        urls = [url for _, url in journal.urls]
+        total = journal.total
+        logger.info(f"Resuming unfinished run: {journal.describe()} already done")
+
+    use_budget = bool(args.budget or args.track_budget)
+    encoding = encoding_key(args.high_quality, args.normalize, args.mono, size_budget=use_budget)
+    manifest = FolderManifest.load(out_folder)
+    sync_plan = None
+    # A resumed run carries on in the folder as it is
+    if not args.resume:
+        if args.mode == "sync" and urls and manifest.can_sync(encoding):
+            sync_plan = manifest.plan_sync(urls)
+        elif args.mode in ("sync", "replace"):
+            clean_output_folder(out_folder)
+            manifest.reset(encoding)
+        elif not manifest.can_sync(encoding):
+            manifest.reset(encoding)
+    slots = get_slot_index(out_folder)
+    if args.mode == "append" and not args.resume:
+        numbers = slots.reserve(total, fill_gaps=args.fill_gaps)
+    else:
+        numbers = list(range(1, total + 1))
+
+    cancel_flag = threading.Event()
+    progress = ProgressModel(total, stages=('download', 'encode') if urls else ('encode',))
+    results = []
+    skipped = []
+
+    def on_track_start(track_idx, title):
+        emit('track_start', track=track_idx, title=title)
+
+    def record(track_idx, success, path, title, error, duplicate_of=None):
+        if track_idx not in journal.completed:
+            if success:
+                journal.complete(track_idx, path)
+            elif duplicate_of is not None and not error:
+                journal.complete(track_idx, duplicate_of=duplicate_of)
+        if duplicate_of is not None and not success and not error:
+            skipped.append(track_idx)
+            emit('track_done', track=track_idx, success=False, path=None, title=title, error=None,
+                 duplicate_of=duplicate_of)
+            return
+        results.append(success)
+        emit('track_done', track=track_idx, success=success, path=path, title=title,
+             error=None if success else (error or "Download failed"), duplicate_of=duplicate_of)
+
+    def task():
+        try:
+            process()
+        except Exception as e:
+            logger.error(f"Command-line run failed: {e}")
+            emit('error', error=str(e))
+
+    def process():
+        coverart_path = args.cover
+        if args.resume:
+            jobs, file_jobs = journal.pending_urls(), journal.pending_files()
+            for idx, entry in sorted(journal.completed.items()):
+                progress.complete(idx)
+                if 'file' in entry:
+                    record(idx, True, os.path.join(out_folder, entry['file']), None, None)
+                else:
+                    record(idx, False, None, None, None, entry.get('duplicate_of'))
+        else:
+            jobs = list(zip(numbers, urls))
+            moved = []
+            if sync_plan:
+                manifest.apply_sync(sync_plan)
+                jobs = sync_plan.downloads
+                moved = [(new_idx, os.path.join(out_folder, f"track{new_idx}.ogg")) for _, new_idx in sync_plan.moves]
+            file_jobs = list(zip(numbers[len(urls):], local_files))
+            journal.start({
+                'inputs': [item if re.match(r'https?://', item) else os.path.abspath(item) for item in args.inputs],
+                'high_quality': args.high_quality,
+                'normalize_audio': args.normalize,
+                'mono_audio': args.mono,
+                'budget': args.budget,
+                'track_budget': args.track_budget,
+                'cover': args.cover,
+            }, jobs, file_jobs, completed=moved)
+            for new_idx, path in moved:
+                progress.complete(new_idx)
+                record(new_idx, True, path, manifest.tracks[new_idx].get('title'), None)
+        budget = None
+        if use_budget:
+            durations = {idx: url_durations.get(url) for idx, url in jobs}
+            durations.update((idx, probe_duration(f)) for idx, f in file_jobs)
+            budget = SizeBudget(total_bytes=args.budget, per_track_bytes=args.track_budget, mono_audio=args.mono,
+                                track_count=len(jobs) + len(file_jobs),
+                                used_bytes=folder_track_bytes(out_folder), durations=durations)
+            logger.info(f"Size budget: {budget.describe()}, {budget.used_bytes / (1024 * 1024):.1f}MB already used")
+        if jobs:
+            pipeline = TrackPipeline(
+                jobs, out_folder,
+                high_quality=args.high_quality,
+                normalize_audio=args.normalize,
+                mono_audio=args.mono,
+                cancel_flag=cancel_flag,
+                convert_workers=args.jobs,
+                on_track_start=on_track_start,
+                on_track_done=lambda r, completed: record(r.idx, r.success, r.path, r.title, r.error, r.duplicate_of),
+                cache=get_conversion_cache(),
+                manifest=manifest,
+                stream=args.stream,
+                progress=progress,
+                budget=budget,
+                duplicates=DuplicateDetector(args.duplicates) if args.dedupe_audio else None,
+                durations=url_durations,
+            )
+            pipeline_results = pipeline.run()
+            thumb_source = next((r for r in pipeline_results if r.success and r.thumbnail), None)
+            keep_cover = sync_plan and os.path.exists(os.path.join(out_folder, "coverart.png"))
+            if is_cd and not coverart_path and thumb_source and not keep_cover and not cancel_flag.is_set():
+                coverart_path = fetch_thumbnail(thumb_source.thumbnail, thumb_source.idx)
+
+        if file_jobs and not cancel_flag.is_set():
+            cache = get_conversion_cache()
+            names = {}
+            scheduler = ConversionScheduler(max_workers=args.jobs, cancel_flag=cancel_flag,
+                                            on_job_start=lambda job_idx: on_track_start(job_idx, names[job_idx]))
+            for idx, localfile in file_jobs:
+                names[idx] = os.path.basename(localfile)
+                scheduler.submit(idx, convert_local_file, localfile, idx, out_folder, args.high_quality,
+                                 normalize_audio=args.normalize, mono_audio=args.mono, cache=cache,
+                                 on_progress=functools.partial(progress.update, idx, 'encode'),
+                                 cancel_flag=cancel_flag, budget=budget)
+            try:
+                for idx, success, result in scheduler.results():
+                    progress.complete(idx)
+                    record(idx, success, result if success else None, names[idx], None if success else result)
+            finally:
+                scheduler.shutdown()
+                cache.log_stats()
+                temp_copy_stats.log_and_reset()
+
+        if (is_cd or args.cover) and coverart_path and not cancel_flag.is_set():
+            save_cover_art(coverart_path, out_folder)
+        if not cancel_flag.is_set():
+            journal.finish()
+
+    # Ctrl+C and SIGTERM cancel the run the same way the Cancel button does
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: cancel_flag.set())
+    emit('start', total=total, output=out_folder, mode="resume" if args.resume else args.mode)
+    started = time.time()
+    worker = threading.Thread(target=task, daemon=True)
+    worker.start()
+    last_report = 0.0
+    while worker.is_alive():
+        worker.join(0.1)
+        if time.time() - last_report >= PROGRESS_POLL_MS / 1000 and worker.is_alive():
+            last_report = time.time()
+            emit('progress', fraction=round(progress.fraction(), 4), eta=progress.eta())
+    slots.settle(numbers)
+
+    succeeded = sum(1 for success in results if success)
+    failed = len(results) - succeeded
+    if cancel_flag.is_set():
+        exit_code = EXIT_CANCELLED
+    elif succeeded == 0:
+        exit_code = EXIT_FAILED
+    elif failed or len(results) + len(skipped) < total:
+        exit_code = EXIT_PARTIAL
+    else:
+        exit_code = EXIT_OK
+    report = finish_run_trace()
+    emit('summary', total=total, succeeded=succeeded, failed=failed, duplicates=len(skipped), cancelled=cancel_flag.is_set(),
+         output=out_folder, folder_bytes=folder_track_bytes(out_folder),
+         seconds=round(time.time() - started, 2), exit_code=exit_code, stages=report['stages'], slowest=report['slowest'], trace=trace.path)
+    sweeper.join()
+    return exit_code
 
 if __name__ == "__main__":
     """Application entry point."""
+    setup_logging()
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     try:
-        logger.info("Creating MSC output directories")
-        for sub in ["Radio", "CD1", "CD2", "CD3"]:
-            os.makedirs(os.path.join(DEFAULT_MSC_PATH, sub), exist_ok=True)
-        
+        load_gui_modules()
         root = tk.Tk()
         logger.info("Starting GUI application")
         
@@ -1105,6 +4469,7 @@ if __name__ == "__main__":
             logger.warning(f"Icon load failed: {e}")
         
         app = MSCPlaylistGUI(root)
+        threading.Thread(target=finish_startup, daemon=True).start()
         logger.info("Starting main application loop")
         root.mainloop()
         
@@ -0,0 +1,65 @@
+"""Ranking of YouTube fallback candidates for region-locked SoundCloud previews."""
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import MSCPlaylistConverter as app
+
+CANDIDATES = [
+    {'id': 'extended', 'title': 'Artist - Song', 'duration': 612},
+    {'id': 'original', 'title': 'Artist - Song', 'duration': 215},
+]
+
+class FallbackSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.cache = app.FallbackSearchCache(os.path.join(cache_dir, 'fallback_search.json'))
+        patches = [
+            mock.patch.object(app, 'get_fallback_search_cache', return_value=self.cache),
+            mock.patch.object(app, '_run_fallback_query', return_value=CANDIDATES),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_closer_length_wins(self):
+        url = app.search_youtube_fallback("Song", "Artist", expected_duration=210)
+        self.assertEqual(url, "https://www.youtube.com/watch?v=original")
+
+    def test_failed_queries_are_not_cached_as_no_match(self):
+        with mock.patch.object(app, '_run_fallback_query', side_effect=IOError("HTTP Error 429")):
+            self.assertIsNone(app.search_youtube_fallback("Song", "Artist"))
+        self.assertEqual(self.cache.get("Song", "Artist"), (False, None))
+
+    def test_duration_reaches_search_from_download(self):
+        preview = {'id': 'p', 'title': 'Song', 'uploader': 'Artist', 'duration': 30, 'ext': 'mp3'}
+
+        class FakeYDL:
+            def __init__(self, opts):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def extract_info(self, url, download=True):
+                return preview
+
+            def prepare_filename(self, info):
+                return os.path.join(tempfile.gettempdir(), 'msc_test_preview.mp3')
+
+        fake_yt_dlp = mock.Mock(YoutubeDL=FakeYDL)
+        with mock.patch.object(app, 'load_yt_dlp', return_value=fake_yt_dlp), \
+                mock.patch.object(app, 'search_youtube_fallback', return_value=None) as search:
+            app.download_track("https://soundcloud.com/artist/song", os.path.join(tempfile.mkdtemp(), 'track1'),
+                               expected_duration=215)
+        search.assert_called_once_with("Song", "Artist", 215)
+
+if __name__ == '__main__':
+    unittest.main()